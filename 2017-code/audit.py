@@ -8,16 +8,22 @@ Routines to work with multi.py on post-election audits.
 """
 
 
+import hashlib
 import os
 import time
 
+import numpy as np
+
 import multi
 import csv_readers
 import ids
+import interning
 import outcomes
+import forecast
 import planner
 import risk_bayes
 import saved_state
+import strata
 import utils
 
 
@@ -73,26 +79,28 @@ def draw_sample(e):
             sample_size = int(e.sn_tp[e.stage_time][pbcid])
             sample_bids = e.bids_p[pbcid][:sample_size]
 
-            avs = []
-            rvs = []
-            for bid in sample_bids:
+            vote_table = interning.table(e, "vote")
+            no_such_contest = vote_table.id(("-NoSuchContest",))
+            av_b = e.av_cpb[cid][pbcid]
+            rv_b = e.rv_cpb[cid][pbcid]
+            av_ids = np.full(len(sample_bids), no_such_contest, dtype=np.int64)
+            rv_ids = np.full(len(sample_bids), no_such_contest, dtype=np.int64)
+            for (i, bid) in enumerate(sample_bids):
                 # actual
-                if bid in e.av_cpb[cid][pbcid]:
-                    avs.append(e.av_cpb[cid][pbcid][bid])
-                else:
-                    avs.append(("-NoSuchContest",))
+                if bid in av_b:
+                    av_ids[i] = vote_table.id(av_b[bid])
                 # reported
-                if bid in e.rv_cpb[cid][pbcid]:
-                    rvs.append(e.rv_cpb[cid][pbcid][bid])
-                else:
-                    rvs.append(("-NoSuchContest",))
-            arvs = list(zip(avs, rvs))  # list of (actual, reported) vote pairs
+                if bid in rv_b:
+                    rv_ids[i] = vote_table.id(rv_b[bid])
 
-            e.sn_tcpra[e.stage_time][cid][pbcid] = outcomes.compute_tally2(arvs)
+            # tally (actual, reported) vote pairs in one pass
+            tally2 = outcomes.compute_tally2_ids(av_ids, rv_ids, vote_table)
+            e.sn_tcpra[e.stage_time][cid][pbcid] = tally2
+            strata.add_sample_votes(e, cid, tally2)
 
             for r in e.rn_cpr[cid][pbcid]:
-                e.sn_tcpr[e.stage_time][cid][pbcid][r] = len(
-                    [rr for rr in rvs if rr == r])
+                e.sn_tcpr[e.stage_time][cid][pbcid][r] = \
+                    sum(tally2.get(r, {}).values())
 
 
 def show_sample_counts(e):
@@ -155,6 +163,9 @@ def show_risks_and_statuses(e):
                       "Risk={}".format(e.risk_tm[e.stage_time][mid]),
                       "(limits {},{})".format(e.risk_limit_m[mid],
                                               e.risk_upset_m[mid]),
+                      "(trials {}, interval [{:.5f},{:.5f}])"
+                      .format(e.risk_trials_tm[e.stage_time][mid],
+                              *e.risk_interval_tm[e.stage_time][mid]),
                       e.status_tm[e.stage_time][mid])
     utils.myprint("    Election status:", e.election_status_t[e.stage_time])
 
@@ -351,6 +362,29 @@ def show_audit_spec(e):
                   " in compute_contest_risk (e.n_trials):")
     utils.myprint("    {}".format(e.n_trials))
 
+    utils.myprint("Stop risk estimation early when clearly decided (e.adaptive_trials):")
+    utils.myprint("    {}".format(e.adaptive_trials))
+    if e.adaptive_trials:
+        utils.myprint("    in chunks of {} trials (e.n_trials_chunk),"
+                      " at confidence {} (e.adaptive_confidence)"
+                      .format(e.n_trials_chunk, e.adaptive_confidence))
+    utils.myprint("Planner for next stage's sample sizes (e.planner):")
+    utils.myprint("    {}".format(e.planner))
+    if e.planner == "optimize":
+        utils.myprint("    {} trials per candidate plan (e.plan_trials),"
+                      " at most {} seconds (e.plan_time_budget)"
+                      .format(e.plan_trials, e.plan_time_budget))
+    if e.planner == "surrogate":
+        utils.myprint("    {} candidate plans screened (e.surrogate_candidates),"
+                      " best {} checked with {} trials"
+                      " (e.surrogate_confirm, e.plan_trials)"
+                      .format(e.surrogate_candidates, e.surrogate_confirm,
+                              e.plan_trials))
+    if e.planner == "walk":
+        utils.myprint("    step schedule {} (e.walk_schedule),"
+                      " at most {} seconds (e.plan_time_budget)"
+                      .format(e.walk_schedule, e.plan_time_budget))
+
     utils.myprint("Dirichlet hyperparameter for base case or non-matching reported/actual votes")
     utils.myprint("(e.pseudocount_base):")
     utils.myprint("    {}".format(e.pseudocount_base))
@@ -377,9 +411,35 @@ def show_audit_stage_header(e):
                             last_s[pbcid]))
 
 
+AUDITED_VOTES_CHECK_BYTES = 2**16
+# number of bytes just before the offset read up to that are checked
+# (see read_audited_votes) to tell an appended file from a rewritten one
+
+
+def check_bytes_sha256(file_pathname, offset):
+    """
+    Return SHA-256 hash of the (up to) AUDITED_VOTES_CHECK_BYTES bytes
+    of the file just before byte offset.
+    """
+
+    start = max(0, offset - AUDITED_VOTES_CHECK_BYTES)
+    return utils.file_sha256(file_pathname, offset - start, start)
+
+
 def read_audited_votes(e):
     """ 
     Read audited votes from 3-audit/33-audited-votes/audited-votes-PBCID.csv 
+
+    Reading is incremental: e.audited_votes_read_p records, for each
+    pbcid, which file has been read, up to what byte offset, a running
+    SHA-256 hash of the part read (updated as new bytes are read, so
+    the part already read is never read again), and the hash of the
+    last (up to) AUDITED_VOTES_CHECK_BYTES bytes read.  If the newest
+    file for pbcid is the same file, at least as long, and still has
+    those last bytes, only the rows appended since are read.  Otherwise
+    (a new version of the file, or a file rewritten rather than
+    appended to) the pbcid's audited votes are cleared and its file is
+    read in full.
     """
 
     election_pathname = os.path.join(multi.ELECTIONS_ROOT,
@@ -393,14 +453,28 @@ def read_audited_votes(e):
                                        "audited-votes-"+safe_pbcid,
                                        ".csv")
         file_pathname = os.path.join(audited_votes_pathname, filename)
+        read = e.audited_votes_read_p.get(pbcid)
+        if read != None and not \
+           (read["filename"] == filename and
+            os.path.getsize(file_pathname) >= read["offset"] and
+            check_bytes_sha256(file_pathname, read["offset"]) == read["check_sha256"]):
+            for cid in e.av_cpb:
+                e.av_cpb[cid].pop(pbcid, None)
+            read = None
+        if read == None:
+            read = {"filename": filename,
+                    "offset": 0,
+                    "hash": hashlib.sha256()}
         fieldnames = ["Collection", "Ballot id", "Contest", "Selections"]
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
-        for row in rows:
-            pbcid = row["Collection"]
-            bid = row["Ballot id"]
-            cid = row["Contest"]
-            vote = row["Selections"]
-            utils.nested_set(e.av_cpb, [cid, pbcid, bid], vote)
+        for row in csv_readers.iter_csv_file_from(file_pathname, read,
+                                                  fieldnames, varlen=True):
+            utils.nested_set(e.av_cpb,
+                             [row["Contest"], row["Collection"],
+                              interning.table(e, "bid").canonical(row["Ballot id"])],
+                             interning.vote(e, row["Selections"]))
+        read["sha256"] = read["hash"].hexdigest()
+        read["check_sha256"] = check_bytes_sha256(file_pathname, read["offset"])
+        e.audited_votes_read_p[pbcid] = read
 
 
 def audit_stage(e, stage_time):
@@ -423,17 +497,22 @@ def audit_stage(e, stage_time):
     e.sn_tp[e.stage_time] = {}
 
     e.risk_tm[e.stage_time] = {}
+    e.risk_trials_tm[e.stage_time] = {}
+    e.risk_interval_tm[e.stage_time] = {}
     e.sn_tcpra[e.stage_time] = {}
 
     # this is global read, not just per stage, for now
-    read_audited_votes(e)
+    if e.audit_files:
+        read_audited_votes(e)
 
     draw_sample(e)
+    strata.compile_strata(e)
     risk_bayes.compute_risks(e, e.sn_tcpra)
     compute_statuses(e)
 
-    write_audit_output_contest_status(e)
-    write_audit_output_collection_status(e)
+    if e.audit_files:
+        write_audit_output_contest_status(e)
+        write_audit_output_collection_status(e)
 
     show_audit_stage_header(e)
     show_sample_counts(e)
@@ -537,6 +616,8 @@ def audit(e, args):
         audit_stage(e, stage_time)
         if stop_audit(e):
             break
+        if e.forecast_scenarios > 0:
+            forecast.forecast(e)
         planner.compute_plan(e)
 
         print("Slack:", risk_bayes.compute_slack_p(e))
@@ -550,6 +631,69 @@ def audit(e, args):
     show_audit_summary(e)
 
 
+def audit_headless(e, args=None, stage_times=None, max_stages=None,
+                   in_memory=False):
+    """
+    Run audit without interaction: no prompting between stages, and no
+    waiting for the clock to give a new stage_time.
+    Return list, with one entry per stage, of dicts with keys
+        "stage_time"   the stage_time
+        "risk_m"       dict mapping mids to risks
+        "status_m"     dict mapping mids to statuses
+        "sn_p"         dict mapping pbcids to sample sizes
+
+    Stage times are taken from stage_times, if given (a list of
+    strictly increasing strings); otherwise from utils.stage_time_string,
+    which gives the current time to the microsecond (and is always
+    increasing).  Stages are run until stop_audit says to stop, until
+    stage_times runs out, or until max_stages stages (if given) are done.
+
+    If in_memory is True, saved states are kept in e.saved_state_t
+    rather than written to files.  If e.audit_files is False, the audit
+    spec is taken to be already in e (see batch.py).
+    """
+
+    e.saved_state_in_memory = in_memory
+    if e.audit_files:
+        read_audit_spec(e, args)
+    else:
+        check_audit_spec(e)
+    initialize_audit(e)
+    saved_state.write_initial_saved_state(e)
+    show_audit_spec(e)
+
+    utils.myprint("====== Audit (headless) ======")
+
+    stages = []
+    last_stage_time = None
+    while stage_times == None or stage_times:
+        if stage_times == None:
+            stage_time = utils.stage_time_string(last_stage_time)
+        else:
+            stage_time, stage_times = stage_times[0], stage_times[1:]
+        if max_stages != None and len(stages) >= max_stages:
+            break
+        if stage_time > e.max_stage_time:
+            break
+        if last_stage_time != None and stage_time <= last_stage_time:
+            utils.myerror("Stage time {} is not after previous stage time {}."
+                          .format(stage_time, last_stage_time))
+        last_stage_time = stage_time
+        audit_stage(e, stage_time)
+        stages.append({"stage_time": e.stage_time,
+                       "risk_m": dict(e.risk_tm[e.stage_time]),
+                       "status_m": dict(e.status_tm[e.stage_time]),
+                       "sn_p": dict(e.sn_tp[e.stage_time])})
+        if stop_audit(e):
+            break
+        if e.forecast_scenarios > 0:
+            forecast.forecast(e)
+        planner.compute_plan(e)
+        saved_state.write_intermediate_saved_state(e)
+    show_audit_summary(e)
+    return stages
+
+
 def show_audit_summary(e):
 
     utils.myprint("=============")
@@ -0,0 +1,300 @@
+# batch.py
+# October 18, 2026
+# python3
+
+"""
+Batch runner for regression sweeps: run many synthetic audits end to
+end, one for each (syn2 spec, seed) pair, on a pool of worker processes,
+and write one summary of the results.
+
+Each scenario's election is generated in memory by
+syn2.generate_syn_type_2 from elections/syn2_specs/SPEC.csv (with the
+seed used to shuffle the votes and as the audit seed), and audited by
+audit.audit_headless, again in memory: nothing is read from or written
+to an election directory.  The printed output of each scenario is
+discarded.
+
+Usage, e.g.:
+    python batch.py 1-cvr 3-cvr-nocvr --seeds 1-100 --jobs 8
+
+The summary (one row per scenario: ballots sampled, number of stages,
+final statuses and risks, and wall time for each phase) is written to
+batch-summary-<datetime>.csv (or to the --output file), and some
+totals are printed.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import audit
+import election_spec
+import ids
+import multi
+import reported
+import syn
+import syn2
+import utils
+
+
+def parse_seeds(seeds_string):
+    """
+    Return list of seeds given by a string such as "1-100,200,300-310"
+    (ranges are inclusive).
+    """
+
+    seeds = []
+    for part in seeds_string.split(","):
+        part = part.strip()
+        if part == "":
+            continue
+        try:
+            if "-" in part:
+                lo, hi = part.split("-")
+                seeds.extend(range(int(lo), int(hi)+1))
+            else:
+                seeds.append(int(part))
+        except ValueError:
+            utils.myerror("Illegal seed list: {}".format(seeds_string))
+    return seeds
+
+
+def make_scenarios(specs, seeds, n_trials=None, max_stages=None):
+    """
+    Return list of scenarios (picklable dicts), one for each spec
+    (name of a csv file in syn2_specs, without the .csv) and seed.
+    """
+
+    return [{"spec": spec,
+             "seed": seed,
+             "n_trials": n_trials,
+             "max_stages": max_stages,
+             "elections_root": multi.ELECTIONS_ROOT}
+            for spec in specs
+            for seed in seeds]
+
+
+def prepare_election(e):
+    """
+    Finish election e just generated in memory, as reading its
+    election spec and reported files would have
+    (see election_spec.read_election_spec and reported.read_reported).
+    """
+
+    election_spec.finish_election_spec(e)
+    election_spec.check_election_spec(e)
+    for cid in e.rv_cpb:
+        for pbcid in e.rv_cpb[cid]:
+            for bid in e.rv_cpb[cid][pbcid]:
+                utils.nested_set(e.votes_c, [cid, e.rv_cpb[cid][pbcid][bid]], True)
+    reported.finish_reported(e)
+    reported.check_reported(e)
+
+
+def run_scenario(scenario):
+    """
+    Generate and audit the election for scenario (from make_scenarios),
+    with no output, and return its summary row, a dict.
+    Errors (including fatal ones, from utils.myerror) are recorded
+    in the row rather than stopping the batch.
+    """
+
+    multi.ELECTIONS_ROOT = scenario["elections_root"]
+    utils.myprint_files = {}
+    utils.warnings_given = 0
+    row = {"spec": scenario["spec"],
+           "seed": scenario["seed"],
+           "outcome": "ok",
+           "error": ""}
+    phase_times = [time.time()]
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            e = multi.Election()
+            e.election_dirname = ids.filename_safe("batch-{}-{}"
+                                                   .format(scenario["spec"],
+                                                           scenario["seed"]))
+            e.election_name = e.election_dirname
+            synpar = syn.Syn_Params()
+            synpar.election_dirname = scenario["spec"]
+            synpar.seed = scenario["seed"]
+            syn2.generate_syn_type_2(e, synpar, write_files=False)
+            phase_times.append(time.time())
+
+            prepare_election(e)
+            phase_times.append(time.time())
+
+            e.audit_files = False
+            e.n_jobs = 1
+            if scenario["n_trials"] != None:
+                e.n_trials = scenario["n_trials"]
+            audit.set_audit_seed(e, e.audit_seed)
+            stages = audit.audit_headless(e,
+                                          max_stages=scenario["max_stages"],
+                                          in_memory=True)
+            phase_times.append(time.time())
+    except (Exception, SystemExit) as error:
+        lines = [line for line in output.getvalue().splitlines()
+                 if line.strip() != ""]
+        if isinstance(error, SystemExit) and len(lines) > 0:
+            row["error"] = lines[-1]
+        else:
+            row["error"] = repr(error)
+        row["outcome"] = "error"
+        phase_times.extend([time.time()] * (4 - len(phase_times)))
+        stages = []
+
+    row["stages"] = len(stages)
+    if len(stages) > 0:
+        last = stages[-1]
+        row["ballots"] = sum([len(e.bids_p[pbcid]) for pbcid in e.pbcids])
+        row["sampled"] = sum(last["sn_p"].values())
+        row["sn_p"] = last["sn_p"]
+        row["status_m"] = last["status_m"]
+        row["risk_m"] = last["risk_m"]
+    else:
+        row["ballots"] = row["sampled"] = 0
+        row["sn_p"] = row["status_m"] = row["risk_m"] = {}
+    row["generate_time"] = phase_times[1] - phase_times[0]
+    row["prepare_time"] = phase_times[2] - phase_times[1]
+    row["audit_time"] = phase_times[3] - phase_times[2]
+    row["total_time"] = phase_times[3] - phase_times[0]
+    return row
+
+
+def run_batch(specs, seeds, n_jobs=1, n_trials=None, max_stages=None):
+    """
+    Run all scenarios for specs and seeds on up to n_jobs worker
+    processes; return list of summary rows, in scenario order.
+    """
+
+    scenarios = make_scenarios(specs, seeds, n_trials, max_stages)
+    return utils.parallel_map(run_scenario, scenarios, n_jobs)
+
+
+def write_summary(rows, filename):
+    """ Write summary rows to csv file filename. """
+
+    with open(filename, "w") as file:
+        fieldnames = ["Spec",
+                      "Seed",
+                      "Outcome",
+                      "Stages",
+                      "Number of ballots",
+                      "Number of ballots sampled",
+                      "Sample sizes",
+                      "Final statuses",
+                      "Final risks",
+                      "Generate time",
+                      "Prepare time",
+                      "Audit time",
+                      "Total time",
+                      "Error"]
+        file.write(",".join(fieldnames))
+        file.write("\n")
+        for row in rows:
+            file.write("{},".format(row["spec"]))
+            file.write("{},".format(row["seed"]))
+            file.write("{},".format(row["outcome"]))
+            file.write("{},".format(row["stages"]))
+            file.write("{},".format(row["ballots"]))
+            file.write("{},".format(row["sampled"]))
+            file.write("{},".format(" ".join(["{}:{}".format(pbcid, row["sn_p"][pbcid])
+                                              for pbcid in sorted(row["sn_p"])])))
+            file.write("{},".format(" ".join(["{}:{}".format(mid, row["status_m"][mid])
+                                              for mid in sorted(row["status_m"])])))
+            file.write("{},".format(" ".join(["{}:{:.5f}".format(mid, row["risk_m"][mid])
+                                              for mid in sorted(row["risk_m"])])))
+            file.write("{:.3f},".format(row["generate_time"]))
+            file.write("{:.3f},".format(row["prepare_time"]))
+            file.write("{:.3f},".format(row["audit_time"]))
+            file.write("{:.3f},".format(row["total_time"]))
+            file.write("{}".format(row["error"].replace(",", ";")))
+            file.write("\n")
+
+
+def show_summary(rows):
+
+    print("Batch summary:")
+    for spec in sorted(set([row["spec"] for row in rows])):
+        spec_rows = [row for row in rows if row["spec"] == spec]
+        ok_rows = [row for row in spec_rows if row["outcome"] == "ok"]
+        print("    {}: {} scenarios, {} errors"
+              .format(spec, len(spec_rows), len(spec_rows) - len(ok_rows)))
+        if len(ok_rows) == 0:
+            continue
+        print("        mean ballots sampled: {:.1f}  mean stages: {:.2f}"
+              .format(sum([row["sampled"] for row in ok_rows]) / len(ok_rows),
+                      sum([row["stages"] for row in ok_rows]) / len(ok_rows)))
+        status_counts = {}
+        for row in ok_rows:
+            for mid in row["status_m"]:
+                key = (mid, row["status_m"][mid])
+                status_counts[key] = status_counts.get(key, 0) + 1
+        for (mid, status) in sorted(status_counts):
+            print("        {} {}: {}".format(mid, status,
+                                            status_counts[(mid, status)]))
+        print("        total wall time: {:.1f} seconds"
+              .format(sum([row["total_time"] for row in spec_rows])))
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description=\
+                                     ("batch.py: "
+                                      "Runs synthetic audits (from syn2 specs) "
+                                      "end to end for many seeds, in parallel, "
+                                      "and writes a summary."))
+
+    parser.add_argument("specs",
+                        nargs="+",
+                        help="Names of syn2 specs (csv files within the "
+                             "syn2_specs subdirectory of the elections root, "
+                             "without the .csv).")
+
+    parser.add_argument("--seeds",
+                        help="Seeds to run for each spec, "
+                             "e.g. 1-100 or 1,5,7-9.",
+                        default="1")
+
+    parser.add_argument("--jobs",
+                        help="Number of worker processes.",
+                        type=int,
+                        default=1)
+
+    parser.add_argument("--trials",
+                        help="Number of Monte Carlo trials per risk"
+                             " computation (default as in multi.py).",
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--max_stages",
+                        help="Maximum number of stages per audit.",
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--elections_root",
+                        help="Directory holding syn2_specs.",
+                        default="./elections")
+
+    parser.add_argument("--output",
+                        help="Summary csv file"
+                             " (default batch-summary-<datetime>.csv).",
+                        default="")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    multi.ELECTIONS_ROOT = args.elections_root
+    output = args.output
+    if output == "":
+        output = "batch-summary-{}.csv".format(utils.datetime_string())
+    rows = run_batch(args.specs, parse_seeds(args.seeds), args.jobs,
+                     args.trials, args.max_stages)
+    write_summary(rows, output)
+    show_summary(rows)
+    print("Summary written to:", output)
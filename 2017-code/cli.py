@@ -47,6 +47,47 @@ def parse_args():
                               "auditing (arbitrary nonnegative integer)."
                               "(If omitted, sets from file, else clock.)"))
 
+    parser.add_argument("--adaptive_trials",
+                        action="store_true",
+                        help=("Stop each risk computation early once the risk is"
+                              " clearly below its limit or above its upset"
+                              " threshold."))
+
+    parser.add_argument("--jobs",
+                        type=int,
+                        help=("Number of worker processes to use (default 1)."),
+                        default=1)
+
+    parser.add_argument("--risk_cache_size",
+                        type=int,
+                        help=("Max number of risk results kept in the risk"
+                              " cache (default 1000; 0 turns it off)."),
+                        default=1000)
+
+    parser.add_argument("--planner",
+                        choices=["fixed", "optimize", "walk", "surrogate"],
+                        help=("Planner for next stage's sample sizes:"
+                              " fixed (max audit rate for each pbcid still"
+                              " being audited; default), optimize (search"
+                              " for smallest sample sizes meeting risk limits),"
+                              " walk (same, by a random walk; for many"
+                              " collections), or surrogate (same, by"
+                              " screening many plans with a fast risk model)."),
+                        default="fixed")
+
+    parser.add_argument("--plan_time_budget",
+                        type=float,
+                        help=("Max seconds the optimize or walk planner may run"
+                              " (default 10)."),
+                        default=10.0)
+
+    parser.add_argument("--forecast",
+                        type=int,
+                        help=("After each stage, forecast the remaining"
+                              " workload by simulating this many scenarios"
+                              " (default 0: no forecast)."),
+                        default=0)
+
     parser.add_argument("--read_election_spec",
                         action="store_true",
                         help="Read and check election spec.")
@@ -68,6 +109,17 @@ def parse_args():
                         action="store_true",
                         help="Run audit based on current info.")
 
+    parser.add_argument("--no_input_cache",
+                        action="store_true",
+                        help="Don't use or write the cache of parsed"
+                             " reported CVRs and ballot manifests.")
+
+    parser.add_argument("--headless",
+                        action="store_true",
+                        help="With --audit: run stages one after another"
+                             " until the audit stops, without prompting"
+                             " or pausing between stages.")
+
     args = parser.parse_args()
     # print("Command line arguments:", args)
     return args
@@ -81,6 +133,21 @@ def process_args(e, args):
 
     ELECTIONS_ROOT = args.elections_root
 
+    e.n_jobs = args.jobs
+
+    e.risk_cache_size = args.risk_cache_size
+
+    e.input_cache = not args.no_input_cache
+
+    e.planner = args.planner
+
+    e.plan_time_budget = args.plan_time_budget
+
+    e.forecast_scenarios = args.forecast
+
+    if args.adaptive_trials:
+        e.adaptive_trials = True
+
     if args.set_audit_seed != None:
         audit.set_audit_seed(e, args.set_audit_seed)
 
@@ -103,7 +170,10 @@ def process_args(e, args):
     elif args.audit:
         election_spec.read_election_spec(e)
         reported.read_reported(e)
-        audit.audit(e, args)
+        if args.headless:
+            audit.audit_headless(e, args)
+        else:
+            audit.audit(e, args)
 
 
 
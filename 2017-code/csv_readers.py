@@ -19,6 +19,8 @@ So the data row may be shorter (by one), equal to, or longer than the header row
 In any case, the values for the last field are *always* compiled into a tuple
 (possibly an empty tuple).
 The reader returns a list of dictionaries, one per row.
+(iter_csv_file yields the same dictionaries one at a time instead,
+for large files such as CVR files.)
 Example (regular csv file):
     A,B,C
     1,2,3
@@ -40,68 +42,168 @@ becomes:
 """
 
 import csv
+import locale
 
 import ids
 import utils
 
 
-def read_csv_file(filename, required_fieldnames=None, varlen=False):
+def clean_fieldnames(filename, fieldnames, required_fieldnames=None):
+    """
+    Return header fieldnames of CSV file filename, cleaned and trimmed,
+    after checking that required fieldnames are present.
+    """
+
+    # gather, clean, and trim field names, eliminating blanks
+    fieldnames = [ids.clean_id(fieldname) for fieldname in fieldnames]
+    while len(fieldnames)>0 and fieldnames[-1]=='':
+        fieldnames.pop()
+    if len(set(fieldnames)) != len(fieldnames):
+        utils.myerror("Duplicate field name:"+str(fieldnames))
+
+    if required_fieldnames != None:
+        # check that all required fieldnames are present
+        required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
+        missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
+        if len(missing_fieldnames) > 0:
+            utils.myerror("File {} has fieldnames {}, while {} are required. Missing {}."
+                          .format(filename, fieldnames,
+                                  required_fieldnames, missing_fieldnames))
+        # check to see if extra fieldnames present; warn user if so
+        extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
+        if len(extra_fieldnames) > 0:
+            utils.mywarning("File {} has extra fieldnames (ignored): {}"
+                            .format(filename, extra_fieldnames))
+    return fieldnames
+
+
+def iter_row_dicts(fieldnames, reader, varlen=False):
+    """
+    Yield a row dict for each data row from csv reader, given the
+    (cleaned) header fieldnames.
+    """
+
+    for row in reader:
+        row = ["" if item==None else ids.clean_id(item) for item in row]
+        while len(row)>0 and row[-1] == '':
+            row.pop()
+        if not varlen:
+            if len(row) > len(fieldnames):
+                utils.mywarning("Ignoring extra values in row:"+str(row))
+                row = row[:len(fieldnames)]
+            while len(row) < len(fieldnames):
+                row.append("")
+        row_dict = {}
+        for (fieldname, value) in zip(fieldnames, row):
+            row_dict[fieldname] = value
+        if varlen:
+            if len(row) < len(fieldnames)-1:
+                if len(row) > 0:
+                    utils.mywarning("Ignoring too-short row:"+str(row))
+                continue
+            last_fieldname = fieldnames[-1]
+            last_value = tuple(row[len(fieldnames)-1:])
+            row_dict[last_fieldname] = last_value
+        yield row_dict
+
+
+def iter_csv_file(filename, required_fieldnames=None, varlen=False):
     """
     Read CSV file and check required fieldnames present; varlen if variable-length rows.
+    Generator: the header is read and checked first, then the row dicts
+    are yielded one at a time, so the whole file is never in memory.
     """
 
     # print("Reading CSV file:", filename)
     with open(filename) as file:
         reader = csv.reader(file)
-        rows = [row for row in reader]
-        fieldnames = rows[0]
-        rows = rows[1:]
-        
-        # gather, clean, and trim field names, eliminating blanks
-        fieldnames = [ids.clean_id(fieldname) for fieldname in fieldnames]
-        while len(fieldnames)>0 and fieldnames[-1]=='':
-            fieldnames.pop()
-        if len(set(fieldnames)) != len(fieldnames):
-            utils.myerror("Duplicate field name:"+fieldnames)
-
-        # data rows
-        row_dicts = []
-        for row in rows:
-            row = ["" if item==None else ids.clean_id(item) for item in row]
-            while len(row)>0 and row[-1] == '':
-                row.pop()
-            if not varlen:
-                if len(row) > len(fieldnames):
-                    utils.mywarning("Ignoring extra values in row:"+str(row))
-                    row = row[:len(fieldnames)]
-                while len(row) < len(fieldnames):
-                    row.append("")
-            row_dict = {}
-            for (fieldname, value) in zip(fieldnames, row):
-                row_dict[fieldname] = value
-            if varlen:
-                if len(row) < len(fieldnames)-1:
-                    if len(row) > 0:
-                        utils.mywarning("Ignoring too-short row:"+str(row))
-                    continue
-                last_fieldname = fieldnames[-1]
-                last_value = tuple(row[len(fieldnames)-1:])
-                row_dict[last_fieldname] = last_value
-            row_dicts.append(row_dict)
-        if required_fieldnames != None:
-            # check that all required fieldnames are present
-            required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
-            missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
-            if len(missing_fieldnames) > 0:
-                utils.myerror("File {} has fieldnames {}, while {} are required. Missing {}."
-                              .format(filename, fieldnames,
-                                      required_fieldnames, missing_fieldnames))
-            # check to see if extra fieldnames present; warn user if so
-            extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
-            if len(extra_fieldnames) > 0:
-                utils.mywarning("File {} has extra fieldnames (ignored): {}"
-                                .format(filename, extra_fieldnames))
-        return row_dicts
+        fieldnames = clean_fieldnames(filename, next(reader, []),
+                                      required_fieldnames)
+        yield from iter_row_dicts(fieldnames, reader, varlen)
+
+
+def iter_csv_file_from(filename, read, required_fieldnames=None, varlen=False):
+    """
+    Read CSV file from byte offset read["offset"] on (for a file being
+    appended to), yielding the row dicts (as for iter_csv_file) for the
+    data rows starting there (or just after the header, if the offset
+    is 0), one at a time.
+    Only complete (newline-terminated) lines are read: a final
+    incomplete line may still be being written, so it is left to be
+    read next time.  As lines are read, read["offset"] is advanced
+    past them and read["hash"] (a hashlib hash, e.g. hashlib.sha256(),
+    of the part of the file before the offset) is updated with them,
+    so afterwards read describes the whole part of the file read.
+    The header is read and checked in any case.
+    """
+
+    encoding = locale.getpreferredencoding(False)
+    # decoded as open() would decode it
+    with open(filename, "rb") as file:
+        header = file.readline()
+        fieldnames = clean_fieldnames(filename,
+                                      next(csv.reader([header.decode(encoding)]), []),
+                                      required_fieldnames)
+        if read["offset"] < file.tell():
+            read["offset"] = file.tell()
+            read["hash"].update(header)
+        file.seek(read["offset"])
+
+        def complete_lines():
+            for line in file:
+                if not line.endswith(b"\n"):
+                    utils.mywarning("Not yet reading incomplete last line of {}: {}"
+                                    .format(filename, line))
+                    return
+                read["offset"] += len(line)
+                read["hash"].update(line)
+                yield line.decode(encoding)
+
+        yield from iter_row_dicts(fieldnames, csv.reader(complete_lines()), varlen)
+
+
+def read_csv_file(filename, required_fieldnames=None, varlen=False):
+    """
+    Read CSV file and check required fieldnames present; varlen if variable-length rows.
+    Return list of row dicts (see iter_csv_file).
+    """
+
+    return list(iter_csv_file(filename, required_fieldnames, varlen))
+
+
+def test_iter_csv_file_from():
+    """
+    Read a file as it is appended to, with a half-written last row.
+    """
+
+    import hashlib
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "audited-votes-PBC1.csv")
+        with open(filename, "w") as file:
+            file.write("Collection,Ballot id,Contest,Selections\n")
+            file.write("PBC1,B1,Mayor,Alice\n")
+        read = {"offset": 0, "hash": hashlib.sha256()}
+        rows = list(iter_csv_file_from(filename, read, varlen=True))
+        print("Read:", rows, read["offset"])
+        assert [row["Ballot id"] for row in rows] == ["B1"]
+        end = read["offset"]
+
+        with open(filename, "a") as file:
+            file.write("PBC1,B2,Mayor,Bo")
+        rows = list(iter_csv_file_from(filename, read, varlen=True))
+        print("After half-written row:", rows, read["offset"])
+        assert rows == [] and read["offset"] == end
+
+        with open(filename, "a") as file:
+            file.write("b\n")
+        rows = list(iter_csv_file_from(filename, read, varlen=True))
+        print("After row completed:", rows, read["offset"])
+        assert [row["Selections"] for row in rows] == [("Bob",)]
+        assert read["offset"] == os.path.getsize(filename)
+        assert read["hash"].hexdigest() == utils.file_sha256(filename)
 
 
 if __name__=="__main__":
@@ -120,5 +222,4 @@ if __name__=="__main__":
             print("{}:'{}' ".format(fieldname, row[fieldname]), end='')
         print()
 
-
-    
+    test_iter_csv_file_from()
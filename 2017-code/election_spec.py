@@ -61,6 +61,7 @@ import os
 import multi
 import csv_readers
 import groups
+import interning
 import utils
 
 
@@ -212,6 +213,7 @@ def finish_election_spec(e):
 
     finish_election_spec_contest_groups(e)
     finish_election_spec_votes(e)
+    interning.intern_election_spec(e)
 
     
 def finish_election_spec_contest_groups(e):
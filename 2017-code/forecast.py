@@ -0,0 +1,370 @@
+# forecast.py
+# October 18, 2026
+# python3
+
+"""
+Forecast the remaining workload of an audit: how many more ballots each
+paper ballot collection will have to pull before the audit finishes, and
+how many more stages it will take.
+
+Each scenario is one hypothetical future.  The actual votes on the
+unsampled ballots of each stratum (pbcid and reported vote) are drawn
+from the current posterior (vote shares from the Dirichlet posterior of
+risk_bayes.py).  Then the stage loop of audit.audit is simulated:
+
+    - each pbcid that may hold a contest with an Open measurement
+      (e.possible_pbcid_c) pulls its max audit rate of further ballots,
+      as planned by planner.compute_plan_fixed, whatever e.planner is
+      (the other planners run Monte Carlo, far too slow to simulate
+      here, and usually need fewer ballots and stages, so the forecast
+      is then an upper estimate); the ballots pulled from a pbcid are
+      drawn without replacement from its unsampled ballots (a
+      multivariate hypergeometric split over each contest's strata in
+      the pbcid and its other ballots), with actual votes drawn from
+      the scenario's vote shares;
+    - each measurement's risk is re-measured (by the normal approximation
+      to the Bayes risk of risk_normal.py, since running Monte Carlo for
+      every scenario and stage would be far too slow), and its status
+      updated as by audit.compute_statuses.  As in the "surrogate"
+      planner, standard deviations are scaled by the contest's kappa,
+      calibrated against the Monte Carlo risk of the current stage
+      (and kept for the simulated stages);
+    - the audit stops when no Active measurement is still Open
+      (audit.stop_audit), or after e.forecast_max_stages stages.
+
+Scenarios are simulated together, as arrays with a leading scenario
+axis, in chunks of e.forecast_chunk scenarios run in up to e.n_jobs
+worker processes.
+"""
+
+import os
+
+import numpy as np
+
+import audit
+import audit_orders
+import multi
+import outcomes
+import planner
+import risk_bayes
+import risk_normal
+import strata
+import utils
+
+
+def forecast_seed(e, chunk):
+    """
+    Return seed for the random stream of the given chunk of scenarios
+    (derived from e.audit_seed and e.stage_time).
+    """
+
+    if e.audit_seed == None:
+        return int(audit.auditRandomState.randint(2**31))
+    hash_input = bytearray(str(e.audit_seed)+",forecast,"+e.stage_time+
+                           ","+str(chunk), 'utf-8')
+    return audit_orders.sha256(hash_input)
+
+
+def make_forecast_contest(e, cid, mid, pbcids):
+    """
+    Return dict describing cid for the forecast (picklable): its
+    strata (those with reported ballots), as arrays over strata s and
+    lumped votes v (see strata.ContestStrata.lumping), and the kappa
+    of its surrogate, calibrated against the Monte Carlo risk of mid
+    (see planner.make_surrogate).
+    """
+
+    cs = strata.get_strata(e, cid)
+    votes, lump_v = cs.lumping(e.contest_type_c[cid])
+    lump_vl = np.zeros((len(cs.votes), len(votes)))
+    lump_vl[np.arange(len(cs.votes)), lump_v] = 1.0
+    p_s, r_s = np.nonzero(cs.rn_pr > 0)
+    ro_index = risk_bayes.reported_outcome_index(e, cid, cs)
+    valid_v = outcomes.plurality_valid_mask(votes)
+    w = risk_bayes.lumped_index(ro_index, lump_v)
+    return {"cid": cid,
+            "pbcid_s": np.array([pbcids.index(cs.pbcids[p]) for p in p_s],
+                                dtype=int),
+            "possible_p": np.array([pbcids.index(pbcid)
+                                    for pbcid in sorted(e.possible_pbcid_c[cid])],
+                                   dtype=int),
+            "sample_sv": cs.sn_pra[p_s, r_s].dot(lump_vl),
+            "prior_sv": cs.prior_ra[r_s].dot(lump_vl),
+            "rn_s": cs.rn_pr[p_s, r_s],
+            "w": w,
+            "rivals": [v for v in range(len(votes)) if valid_v[v] and v != w],
+            "possible": e.contest_type_c[cid].lower() == "plurality" and
+                        w >= 0 and bool(valid_v[w]),
+            "kappa": planner.make_surrogate(e, cid, mid, pbcids).kappa}
+
+
+def make_forecast_jobs(e):
+    """
+    Return list of forecast jobs (one per chunk of scenarios), each
+    a dict holding everything needed to simulate them (picklable).
+    """
+
+    pbcids = sorted(e.pbcids)
+    mids = sorted(e.mids)
+    cids = sorted(set([e.cid_m[mid] for mid in mids]))
+    mid_c = {}
+    # first mid measuring each cid
+    for mid in mids:
+        mid_c.setdefault(e.cid_m[mid], mid)
+    contests = [make_forecast_contest(e, cid, mid_c[cid], pbcids)
+                for cid in cids]
+    common = {"contests": contests,
+              "rn_p": np.array([e.rn_p[pbcid] for pbcid in pbcids], dtype=float),
+              "sn_p": np.array([e.sn_tp[e.stage_time][pbcid] for pbcid in pbcids],
+                               dtype=float),
+              "rate_p": np.array([int(e.max_audit_rate_p[pbcid])
+                                  for pbcid in pbcids], dtype=float),
+              "contest_m": [cids.index(e.cid_m[mid]) for mid in mids],
+              "risk_limit_m": np.array([e.risk_limit_m[mid] for mid in mids]),
+              "risk_upset_m": np.array([e.risk_upset_m[mid] for mid in mids]),
+              "active_m": np.array([e.sampling_mode_m[mid] == "Active"
+                                    for mid in mids]),
+              "status_m": [e.status_tm[e.stage_time][mid] for mid in mids],
+              "max_stages": e.forecast_max_stages}
+    jobs = []
+    n_chunks = (e.forecast_scenarios + e.forecast_chunk - 1) // e.forecast_chunk
+    for chunk in range(n_chunks):
+        job = dict(common)
+        job["scenarios"] = min(e.forecast_chunk,
+                               e.forecast_scenarios - chunk * e.forecast_chunk)
+        job["rs"] = forecast_seed(e, chunk)
+        jobs.append(job)
+    return jobs
+
+
+def draw_counts(rs, n_xs, share_xsv):
+    """
+    Return array of counts (shape of share_xsv): n_xs[x, s] ballots
+    split among the votes v multinomially with probabilities
+    share_xsv[x, s, v] (as a chain of binomials, so that it works
+    for all x and s at once).
+    """
+
+    count_xsv = np.zeros(share_xsv.shape)
+    remaining_xs = n_xs.astype(np.int64)
+    remaining_share_xs = np.ones(n_xs.shape)
+    for v in range(share_xsv.shape[2] - 1):
+        p_xs = np.clip(share_xsv[:, :, v] /
+                       np.maximum(remaining_share_xs, 1e-300), 0.0, 1.0)
+        count_xsv[:, :, v] = rs.binomial(remaining_xs, p_xs)
+        remaining_xs = remaining_xs - count_xsv[:, :, v].astype(np.int64)
+        remaining_share_xs = remaining_share_xs - share_xsv[:, :, v]
+    count_xsv[:, :, -1] = remaining_xs
+    return count_xsv
+
+
+def draw_hypergeometric(rs, ngood_x, nbad_x, nsample_x):
+    """
+    Return array of hypergeometric draws: for each x, the number of good
+    items among nsample_x[x] drawn without replacement from ngood_x[x]
+    good and nbad_x[x] bad items (zero if nothing is drawn, or there
+    are no good items).
+    """
+
+    count_x = np.zeros(len(nsample_x), dtype=np.int64)
+    ok_x = (nsample_x > 0) & (ngood_x > 0)
+    if np.any(ok_x):
+        count_x[ok_x] = rs.hypergeometric(ngood_x[ok_x], nbad_x[ok_x],
+                                          nsample_x[ok_x])
+    return count_x
+
+
+def draw_new_ballots(rs, pbcid_s, nonsample_xs, unsampled_xp, increment_xp):
+    """
+    Return array new_xs: how many of the increment_xp[x, p] ballots
+    newly pulled from each pbcid p fall in each stratum s of a contest,
+    drawn without replacement (a multivariate hypergeometric split, as
+    a chain of hypergeometric draws) from the pbcid's unsampled_xp[x, p]
+    ballots, nonsample_xs[x, s] of which are in stratum s (for the
+    strata s of the contest in p, pbcid_s[s] == p); the rest are not
+    in the contest.  So for each pbcid, the new ballots of all its
+    strata plus those not in the contest add up to its increment.
+    """
+
+    new_xs = np.zeros(nonsample_xs.shape)
+    for p in np.unique(pbcid_s):
+        strata_p = np.nonzero(pbcid_s == p)[0]
+        nonsample_xs_p = nonsample_xs[:, strata_p].astype(np.int64)
+        remaining_x = np.maximum(unsampled_xp[:, p].astype(np.int64),
+                                 nonsample_xs_p.sum(axis=1))
+        nsample_x = increment_xp[:, p].astype(np.int64)
+        for (i, s) in enumerate(strata_p):
+            ngood_x = nonsample_xs_p[:, i]
+            new_x = draw_hypergeometric(rs, ngood_x, remaining_x - ngood_x,
+                                        nsample_x)
+            new_xs[:, s] = new_x
+            remaining_x = remaining_x - ngood_x
+            nsample_x = nsample_x - new_x
+    return new_xs
+
+
+def run_forecast_job(job):
+    """
+    Simulate the job's scenarios; return (extra_xp, stages_x, status_xm):
+    for each scenario x, the number of further ballots pulled from
+    each pbcid, the number of further stages, and the final status of
+    each measurement (as strings).
+    """
+
+    rs = utils.RandomState(job["rs"])
+    X = job["scenarios"]
+    contests = job["contests"]
+    n_pbcids = len(job["rn_p"])
+
+    # vote shares for each scenario, and current sample/nonsample
+    share_c, sample_c, nonsample_c = [], [], []
+    for contest in contests:
+        alpha_sv = contest["sample_sv"] + contest["prior_sv"]
+        gammas_xsv = rs.gamma(alpha_sv, size=(X,)+alpha_sv.shape)
+        share_c.append(gammas_xsv / gammas_xsv.sum(axis=2, keepdims=True))
+        sample_c.append(np.tile(contest["sample_sv"], (X, 1, 1)))
+        nonsample_c.append(np.tile(contest["rn_s"] -
+                                   contest["sample_sv"].sum(axis=1), (X, 1)))
+    sn_xp = np.tile(job["sn_p"], (X, 1))
+    status_xm = np.tile(np.array(job["status_m"], dtype=object), (X, 1))
+    stages_x = np.zeros(X, dtype=int)
+
+    for stage in range(job["max_stages"]):
+        running_x = np.any((status_xm == "Open") & job["active_m"], axis=1)
+        if not np.any(running_x):
+            break
+        stages_x += running_x
+
+        # plan: max audit rate for pbcids touching an Open measurement
+        touched_xp = np.zeros((X, n_pbcids), dtype=bool)
+        for m, c in enumerate(job["contest_m"]):
+            open_x = running_x & (status_xm[:, m] == "Open")
+            touched_xp[:, contests[c]["possible_p"]] |= open_x[:, None]
+        new_sn_xp = np.where(touched_xp,
+                             np.minimum(sn_xp + job["rate_p"], job["rn_p"]),
+                             sn_xp)
+        increment_xp = new_sn_xp - sn_xp
+        unsampled_xp = job["rn_p"] - sn_xp
+
+        # draw the new ballots for each contest's strata
+        for c, contest in enumerate(contests):
+            new_xs = draw_new_ballots(rs, contest["pbcid_s"], nonsample_c[c],
+                                      unsampled_xp, increment_xp)
+            sample_c[c] = sample_c[c] + draw_counts(rs, new_xs, share_c[c])
+            nonsample_c[c] = nonsample_c[c] - new_xs
+        sn_xp = new_sn_xp
+
+        # measure risks, update statuses (only from Open)
+        risk_xc = np.ones((X, len(contests)))
+        for c, contest in enumerate(contests):
+            if not contest["possible"]:
+                continue
+            sampled_xs = sample_c[c].sum(axis=2) > 0
+            alpha_xsv = np.where(sampled_xs[:, :, None],
+                                 sample_c[c] + contest["prior_sv"], 0.0)
+            mean_xl, var_xl = risk_normal.margin_moments_xl(
+                alpha_xsv, np.where(sampled_xs, nonsample_c[c], 0.0),
+                contest["w"], contest["rivals"])
+            risk_xc[:, c] = risk_normal.normal_risk_xl(mean_xl, var_xl,
+                                                       contest["kappa"])
+        exhausted_x = np.all(sn_xp >= job["rn_p"], axis=1)
+        for m, c in enumerate(job["contest_m"]):
+            open_x = running_x & (status_xm[:, m] == "Open")
+            risk_x = risk_xc[:, c]
+            status_xm[open_x & exhausted_x, m] = "Exhausted"
+            open_x &= ~exhausted_x
+            status_xm[open_x & (risk_x < job["risk_limit_m"][m]), m] = "Passed"
+            status_xm[open_x & (risk_x > job["risk_upset_m"][m]), m] = "Upset"
+
+    return sn_xp - job["sn_p"], stages_x, status_xm
+
+
+def forecast(e):
+    """
+    Forecast the remaining workload of the audit (see above), from the
+    current stage, using e.forecast_scenarios scenarios.
+    Return dict with entries:
+        "extra_xp"   array: further ballots pulled, by scenario and pbcid
+        "pbcids"     the pbcids (in order of the pbcid axis)
+        "stages_x"   array: further stages, by scenario
+        "mids"       the mids (in order of the measurement axis)
+        "status_xm"  array: final status, by scenario and measurement
+    Also print a summary, and write it (if e.audit_files) to
+        3-audit/34-audit-output/audit-output-forecast-<stage_time>.csv
+    """
+
+    results = utils.parallel_map(run_forecast_job, make_forecast_jobs(e),
+                                 e.n_jobs)
+    result = {"extra_xp": np.vstack([r[0] for r in results]),
+              "pbcids": sorted(e.pbcids),
+              "stages_x": np.concatenate([r[1] for r in results]),
+              "mids": sorted(e.mids),
+              "status_xm": np.vstack([r[2] for r in results])}
+    show_forecast(e, result)
+    if e.audit_files:
+        write_forecast(e, result)
+    return result
+
+
+QUANTILES = (0.10, 0.50, 0.90)
+
+
+def forecast_rows(result):
+    """
+    Return list of summary rows (lists of strings) for forecast result:
+    one for each pbcid, one for the total, and one for the stages,
+    giving mean, quantiles, and max.
+    """
+
+    rows = []
+    extra_xp = result["extra_xp"]
+    items = [(pbcid, extra_xp[:, p]) for p, pbcid in enumerate(result["pbcids"])]
+    items.append(("Total", extra_xp.sum(axis=1)))
+    items.append(("Stages", result["stages_x"]))
+    for name, values_x in items:
+        rows.append([name, "{:.1f}".format(np.mean(values_x))] +
+                    ["{:.0f}".format(q) for q in np.quantile(values_x, QUANTILES)] +
+                    ["{:.0f}".format(np.max(values_x))])
+    return rows
+
+
+def show_forecast(e, result):
+
+    utils.myprint("Forecast of further ballots to pull ({} scenarios):"
+                  .format(len(result["stages_x"])))
+    utils.myprint("    (simulating the fixed planner: each pbcid of an Open"
+                  " contest pulls its max audit rate each stage)")
+    if e.planner != "fixed":
+        utils.myprint("    (the {} planner in use usually pulls fewer ballots,"
+                      " in fewer stages)".format(e.planner))
+    utils.myprint("    {:20s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}"
+                  .format("", "mean", "10%", "50%", "90%", "max"))
+    for row in forecast_rows(result):
+        utils.myprint("    {:20s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}"
+                      .format(*row))
+    utils.myprint("Forecast final measurement statuses (fraction of scenarios):")
+    for m, mid in enumerate(result["mids"]):
+        statuses = sorted(set(result["status_xm"][:, m]))
+        utils.myprint("    {}: {}".format(mid, ", ".join(
+            ["{} {:.3f}".format(status,
+                                np.mean(result["status_xm"][:, m] == status))
+             for status in statuses])))
+
+
+def write_forecast(e, result):
+    """ Write 3-audit/34-audit-output/audit-output-forecast-<stage_time>.csv """
+
+    dirpath = os.path.join(multi.ELECTIONS_ROOT,
+                           e.election_dirname,
+                           "3-audit",
+                           "34-audit-output")
+    os.makedirs(dirpath, exist_ok=True)
+    filename = os.path.join(dirpath,
+                            "audit-output-forecast-"+e.stage_time+".csv")
+    with open(filename, "w") as file:
+        fieldnames = ["Collection", "Mean", "10%", "50%", "90%", "Max"]
+        file.write(",".join(fieldnames))
+        file.write("\n")
+        for row in forecast_rows(result):
+            file.write(",".join(row))
+            file.write("\n")
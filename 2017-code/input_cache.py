@@ -0,0 +1,259 @@
+# input_cache.py
+# October 18, 2026
+# python3
+
+"""
+Cache of parsed CSV input files (reported CVRs and ballot manifests),
+so that each audit stage doesn't re-parse and re-clean (ids.clean_id)
+every cell of files that never change after the election.
+
+The cache for input file FILE.csv is the directory
+    FILE.csv.cache
+next to it (not matched by utils.greatest_name, which looks for files
+ending in .csv), holding numpy .npy files.  Rows are stored in chunks
+of CHUNK_ROWS rows.  Each chunk has its own table of the distinct
+(cleaned) ids in it, and for each field an array of indices into that
+table (for the last field of a varlen file, the concatenated indices of
+all rows plus an array of row offsets).  The tables of all chunks are
+stored together as UTF-8 text, one id per line (cleaned ids have no
+newlines), with the byte offset of each chunk's table.
+Rows are yielded one at a time, as by csv_readers.iter_csv_file,
+whether they come from the file or from the cache.
+
+Memory use is bounded by the chunk size, not the file size: the cache
+is built while the file is read, a chunk at a time, into temporary
+files, and it is read back a chunk at a time from memory-mapped arrays.
+
+The cache records the SHA-256 hash of the file it was built from.  It
+is used only if that hash matches the file's current hash (and the
+cache version and the varlen flag match); otherwise it is rebuilt.
+Setting e.input_cache to False turns the cache off.
+
+Warnings about malformed rows (see csv_readers.iter_csv_file) are
+only given when the cache is built, not when it is used.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+import csv_readers
+import ids
+import utils
+
+
+CACHE_VERSION = 2
+# bump this whenever csv_readers.iter_csv_file changes what it yields,
+# or the cache format changes
+
+CHUNK_ROWS = 2**14
+# number of rows per chunk
+
+
+def cache_pathname(filename):
+    """ Return pathname of cache directory for input file filename. """
+
+    return filename + ".cache"
+
+
+def column_names(fieldnames, varlen):
+    """
+    Return list of names of the index arrays of a cache (one per field,
+    or for the last field of a varlen file, "values" and "offsets").
+    """
+
+    names = []
+    for (f, fieldname) in enumerate(fieldnames):
+        if varlen and f == len(fieldnames)-1:
+            names.extend(["values", "offsets"])
+        else:
+            names.append("field{}".format(f))
+    return names
+
+
+def write_npy(raw_pathname, npy_pathname, dtype):
+    """
+    Write .npy file npy_pathname holding the array of given dtype whose
+    raw bytes are in file raw_pathname (copied, not loaded into memory).
+    """
+
+    n_items = os.path.getsize(raw_pathname) // np.dtype(dtype).itemsize
+    with open(npy_pathname, "wb") as npy_file, open(raw_pathname, "rb") as raw_file:
+        np.lib.format.write_array_header_1_0(
+            npy_file, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                       "fortran_order": False,
+                       "shape": (n_items,)})
+        shutil.copyfileobj(raw_file, npy_file)
+    os.remove(raw_pathname)
+
+
+def iter_build_cache(filename, sha256, required_fieldnames, varlen):
+    """
+    Parse filename with csv_readers.iter_csv_file, yielding its row
+    dicts, and once all have been yielded, write its cache
+    (replacing any old one).  Each chunk of rows is written out to
+    temporary files as soon as it is complete.
+    """
+
+    temp_pathname = cache_pathname(filename) + ".tmp"
+    try:
+        shutil.rmtree(temp_pathname, ignore_errors=True)
+        os.makedirs(temp_pathname)
+    except OSError:
+        utils.mywarning("Can't write input cache for {}.".format(filename))
+        yield from csv_readers.iter_csv_file(filename, required_fieldnames, varlen)
+        return
+
+    def raw_pathname(name):
+        return os.path.join(temp_pathname, name + ".raw")
+
+    fieldnames = None
+    files = {}
+    # array name->open raw file
+    n_rows = 0
+    n_values = 0
+    # number of values (of last field of varlen file) so far
+    string_bytes = 0
+    # number of bytes of id tables so far
+
+    def write_chunk():
+        nonlocal string_bytes
+        for name in column_names(fieldnames, varlen):
+            dtype = np.int64 if name == "offsets" else np.int32
+            np.array(columns[name], dtype=dtype).tofile(files[name])
+        table = "".join([id + "\n" for id in index_s]).encode("utf-8")
+        files["strings"].write(table)
+        string_bytes += len(table)
+        np.array([string_bytes], dtype=np.int64).tofile(files["chunk_bytes"])
+
+    for row in csv_readers.iter_csv_file(filename, required_fieldnames, varlen):
+        if fieldnames == None:
+            fieldnames = list(row.keys())
+            for name in column_names(fieldnames, varlen) + ["strings", "chunk_bytes"]:
+                files[name] = open(raw_pathname(name), "wb")
+            np.array([0], dtype=np.int64).tofile(files["chunk_bytes"])
+            if varlen:
+                np.array([0], dtype=np.int64).tofile(files["offsets"])
+        if n_rows % CHUNK_ROWS == 0:
+            index_s = {}
+            # id->index in table of ids of this chunk
+            columns = {name: [] for name in column_names(fieldnames, varlen)}
+        for (f, fieldname) in enumerate(fieldnames):
+            if varlen and f == len(fieldnames)-1:
+                columns["values"].extend([index_s.setdefault(value, len(index_s))
+                                          for value in row[fieldname]])
+                n_values += len(row[fieldname])
+                columns["offsets"].append(n_values)
+            else:
+                columns["field{}".format(f)].append(
+                    index_s.setdefault(row[fieldname], len(index_s)))
+        n_rows += 1
+        if n_rows % CHUNK_ROWS == 0:
+            write_chunk()
+        yield row
+    if fieldnames == None:
+        fieldnames = []
+    elif n_rows % CHUNK_ROWS != 0:
+        write_chunk()
+
+    try:
+        for name in files:
+            files[name].close()
+            dtype = {"strings": np.uint8, "offsets": np.int64,
+                     "chunk_bytes": np.int64}.get(name, np.int32)
+            write_npy(raw_pathname(name),
+                      os.path.join(temp_pathname, name + ".npy"), dtype)
+        np.save(os.path.join(temp_pathname, "fieldnames.npy"),
+                np.array(fieldnames, dtype=str))
+        np.save(os.path.join(temp_pathname, "header.npy"),
+                np.array([str(CACHE_VERSION), sha256, str(varlen),
+                          str(n_rows), str(CHUNK_ROWS)]))
+        shutil.rmtree(cache_pathname(filename), ignore_errors=True)
+        os.replace(temp_pathname, cache_pathname(filename))
+    except OSError:
+        shutil.rmtree(temp_pathname, ignore_errors=True)
+        utils.mywarning("Can't write input cache for {}.".format(filename))
+
+
+def open_cache(filename, sha256, required_fieldnames, varlen):
+    """
+    Return the cache for filename (for the file with hash sha256), as
+    a dict mapping array names to arrays (memory-mapped, except for the
+    small "header" and "fieldnames"), or None if there is no valid cache.
+    """
+
+    pathname = cache_pathname(filename)
+    if not os.path.isdir(pathname):
+        return None
+    try:
+        data = {name: np.load(os.path.join(pathname, name + ".npy"))
+                for name in ["header", "fieldnames"]}
+        version, cache_sha256, cache_varlen, _, _ = data["header"].tolist()
+        fieldnames = data["fieldnames"].tolist()
+    except (OSError, ValueError):
+        return None
+    if version != str(CACHE_VERSION) or cache_sha256 != sha256 \
+       or cache_varlen != str(varlen) or \
+       (len(fieldnames) > 0 and required_fieldnames != None and
+        not set([ids.clean_id(id) for id in required_fieldnames])
+            .issubset(fieldnames)):
+        return None
+    if len(fieldnames) == 0:
+        return data
+    try:
+        for name in column_names(fieldnames, varlen) + ["strings", "chunk_bytes"]:
+            data[name] = np.load(os.path.join(pathname, name + ".npy"),
+                                 mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return data
+
+
+def iter_cache(data, varlen):
+    """
+    Yield row dicts from cache data (see open_cache), reading one chunk
+    of rows at a time.
+    """
+
+    fieldnames = data["fieldnames"].tolist()
+    _, _, _, n_rows, chunk_rows = data["header"].tolist()
+    n_rows = int(n_rows)
+    chunk_rows = int(chunk_rows)
+    for (k, start) in enumerate(range(0, n_rows, chunk_rows)):
+        stop = min(n_rows, start + chunk_rows)
+        chunk_bytes = data["chunk_bytes"][k:k+2]
+        strings = data["strings"][chunk_bytes[0]:chunk_bytes[1]] \
+                  .tobytes().decode("utf-8").split("\n")
+        columns = []
+        for (f, fieldname) in enumerate(fieldnames):
+            if varlen and f == len(fieldnames)-1:
+                offsets = data["offsets"][start:stop+1].tolist()
+                values = [strings[i] for i in
+                          data["values"][offsets[0]:offsets[-1]].tolist()]
+                base = offsets[0]
+                columns.append([tuple(values[offsets[j]-base:offsets[j+1]-base])
+                                for j in range(stop-start)])
+            else:
+                columns.append([strings[i] for i in
+                                data["field{}".format(f)][start:stop].tolist()])
+        for row in zip(*columns):
+            yield dict(zip(fieldnames, row))
+
+
+def iter_csv_file(filename, required_fieldnames=None, varlen=False,
+                  use_cache=True):
+    """
+    Yield row dicts for csv file filename, as csv_readers.iter_csv_file
+    does, from the cache if it is valid, and otherwise from the file
+    itself (then (re)building the cache).
+    If use_cache is False (e.g., e.input_cache is False), just read the file.
+    """
+
+    if not use_cache:
+        return csv_readers.iter_csv_file(filename, required_fieldnames, varlen)
+    sha256 = utils.file_sha256(filename)
+    data = open_cache(filename, sha256, required_fieldnames, varlen)
+    if data == None:
+        return iter_build_cache(filename, sha256, required_fieldnames, varlen)
+    return iter_cache(data, varlen)
@@ -0,0 +1,129 @@
+# interning.py
+# October 18, 2026
+# python3
+
+"""
+Interning of ids and votes.
+
+Election data keys nearly everything by strings (cids, pbcids, bids,
+selids) and by votes (tuples of selids).  Read naively, the same vote
+tuple (or bid string) is a separate object for each ballot and contest
+it appears in.  An IdTable gives each distinct value of one kind a
+dense integer id (0, 1, 2, ...) and one canonical object; data are
+interned as they are read (see reported.read_reported_cvrs and
+audit.read_audited_votes), so that equal values share one object.
+
+The integer ids let hot code work with numpy arrays instead of
+strings and tuples (see outcomes.compute_tally2_ids); readable values
+are recovered with IdTable.value(s).
+
+The tables for election e are in e.id_table_k, by kind:
+    "cid", "pbcid", "bid", "selid", "vote"
+"""
+
+import numpy as np
+
+
+KINDS = ["cid", "pbcid", "bid", "selid", "vote"]
+
+
+class IdTable(object):
+    """ Dense integer ids, and canonical objects, for values of one kind. """
+
+    def __init__(self):
+
+        self.id_x = {}
+        # value->id
+        self.x_id = []
+        # id->value (the canonical object)
+
+    def __len__(self):
+
+        return len(self.x_id)
+
+    def canonical(self, x):
+        """ Return the canonical object equal to x (giving x an id if new). """
+
+        i = self.id_x.get(x)
+        if i == None:
+            self.id_x[x] = len(self.x_id)
+            self.x_id.append(x)
+            return x
+        return self.x_id[i]
+
+    def id(self, x):
+        """ Return the id of x (giving it one if it is new). """
+
+        i = self.id_x.get(x)
+        if i == None:
+            i = len(self.x_id)
+            self.id_x[x] = i
+            self.x_id.append(x)
+        return i
+
+    def ids(self, xs):
+        """ Return numpy array of the ids of the values in xs. """
+
+        return np.fromiter((self.id(x) for x in xs), dtype=np.int64)
+
+    def value(self, i):
+        """ Return the value with id i. """
+
+        return self.x_id[i]
+
+    def values(self, ids):
+        """ Return list of the values with the given ids. """
+
+        return [self.x_id[i] for i in ids]
+
+
+def table(e, kind):
+    """ Return IdTable of given kind for election e (making it if needed). """
+
+    if kind not in e.id_table_k:
+        if kind not in KINDS:
+            raise ValueError("unknown kind of id: {}".format(kind))
+        e.id_table_k[kind] = IdTable()
+    return e.id_table_k[kind]
+
+
+def vote(e, vote):
+    """
+    Return canonical object for vote (a tuple of selids);
+    the selids of a new vote are interned too.
+    """
+
+    vote_table = table(e, "vote")
+    i = vote_table.id_x.get(vote)
+    if i != None:
+        return vote_table.x_id[i]
+    selid_table = table(e, "selid")
+    return vote_table.canonical(tuple([selid_table.canonical(selid)
+                                       for selid in vote]))
+
+
+def intern_election_spec(e):
+    """
+    Give ids to the cids, pbcids, selids, and votes of the election
+    spec (so these get the first, smallest ids, in spec order).
+    """
+
+    for cid in e.cids:
+        table(e, "cid").id(cid)
+    for pbcid in e.pbcids:
+        table(e, "pbcid").id(pbcid)
+    for cid in e.cids:
+        for selid in e.selids_c[cid]:
+            table(e, "selid").id(selid)
+        e.votes_c[cid] = {vote(e, v): e.votes_c[cid][v]
+                          for v in e.votes_c[cid]}
+
+
+def intern_votes_b(e, vote_b):
+    """
+    Return dict mapping bids to votes like vote_b, but with interned
+    bids and votes.
+    """
+
+    bid_table = table(e, "bid")
+    return {bid_table.canonical(bid): vote(e, v) for (bid, v) in vote_b.items()}
@@ -0,0 +1,256 @@
+# manifest.py
+# October 18, 2026
+# python3
+
+"""
+Range-encoded ballot manifests.
+
+A ballot manifest row describes a run of num ballots (a batch): the
+first ballot id, box, position, and stamp, plus attributes shared by
+all ballots of the run (box, required and possible contest groups,
+comments).  Ballot ids, positions, and stamps within a run count on
+from the first one (see utils.count_on).
+
+Rather than expanding each row into num ballots, with a dict entry
+per ballot for each attribute, a PbcManifest keeps the rows as runs
+and computes per-ballot values on demand:
+
+    BidList            the list of bids of a pbcid, in manifest order,
+                       as a read-only sequence (used for e.bids_p[pbcid])
+    AttributeView      mapping from bids to one attribute
+                       (used for e.boxid_pb[pbcid], e.position_pb[pbcid], ...)
+
+Looking up a bid finds its run by binary search on its numeric suffix.
+Memory is proportional to the number of manifest rows, not ballots.
+"""
+
+import array
+import bisect
+import collections.abc
+
+import utils
+
+
+ATTRIBUTES = ["boxid", "position", "stamp",
+              "required_gid", "possible_gid", "comments"]
+# per-ballot attributes of a manifest, as in e.boxid_pb etc.
+
+COUNTED_ATTRIBUTES = ["position", "stamp"]
+# attributes that count on within a run (like bids); others are shared
+
+
+def split_id(id):
+    """
+    Return (prefix, digits): id split into its trailing decimal field
+    and everything before it (as in utils.count_on).
+    """
+
+    i = len(id)
+    while i > 0 and id[i-1].isdigit():
+        i -= 1
+    return id[:i], id[i:]
+
+
+class PbcManifest(object):
+    """
+    Ballot manifest of one paper ballot collection, as a list of runs,
+    stored by column: run k has first bid self.bid_k[k], self.num_k[k]
+    ballots, and attribute a (one of the ATTRIBUTES) self.value_ak[a][k],
+    these being the values of the run's manifest row.
+    """
+
+    def __init__(self):
+
+        self.bid_k = []
+        self.num_k = array.array("q")
+        self.value_ak = {attribute: [] for attribute in ATTRIBUTES}
+        self.starts = array.array("q", [0])
+        # self.starts[k] is index (in manifest order) of first ballot of run k;
+        # self.starts[-1] is total number of ballots
+        self.index = None
+        # for find(); built when first needed
+
+    def add_runs(self, runs):
+        """
+        Add runs, given by column as a dict with keys "bid", "num",
+        and the ATTRIBUTES, each giving a list of values, one per run.
+        """
+
+        self.bid_k.extend(runs["bid"])
+        self.num_k.extend(runs["num"])
+        for attribute in ATTRIBUTES:
+            self.value_ak[attribute].extend(runs[attribute])
+        for num in runs["num"]:
+            self.starts.append(self.starts[-1] + num)
+        self.index = None
+
+    def __len__(self):
+
+        return self.starts[-1]
+
+    def locate(self, i):
+        """ Return (k, j): ballot i (in manifest order) is ballot j of run k. """
+
+        if not 0 <= i < len(self):
+            raise IndexError("ballot index out of range")
+        k = bisect.bisect_right(self.starts, i) - 1
+        return k, i - self.starts[k]
+
+    def bid(self, i):
+        """ Return bid of ballot i (in manifest order). """
+
+        k, j = self.locate(i)
+        return utils.count_on_item(self.bid_k[k], self.num_k[k], j)
+
+    def iter_bids(self):
+
+        for (bid, num) in zip(self.bid_k, self.num_k):
+            if num == 1:
+                yield bid
+            else:
+                yield from utils.count_on(bid, num)
+
+    def build_index(self):
+        """
+        Build index for find().
+
+        For each bid prefix, self.index[prefix] is a pair of lists
+        (counters, runs): the first counter values, in increasing order,
+        and run numbers, of runs with that prefix whose counter ranges
+        do not overlap, so a bid is in at most one of them, found by
+        binary search.
+        Bids of runs of one ballot (whose bid is not counted on), and
+        of the (irregular) runs overlapping an earlier one, are in the
+        dict self.single_b, mapping bid to (k, j).
+        """
+
+        self.index = {}
+        self.single_b = {}
+        intervals = {}
+        for (k, (bid, num)) in enumerate(zip(self.bid_k, self.num_k)):
+            if num == 1:
+                self.single_b.setdefault(bid, (k, 0))
+            elif num > 1:
+                prefix, digits = split_id(bid)
+                counter = int(digits) if digits != "" else 1
+                intervals.setdefault(prefix, []).append((counter, k))
+        for prefix in intervals:
+            counters = []
+            runs = []
+            end = None
+            for (counter, k) in sorted(intervals[prefix]):
+                if end != None and counter < end:
+                    for (j, bid) in enumerate(utils.count_on(self.bid_k[k],
+                                                             self.num_k[k])):
+                        self.single_b.setdefault(bid, (k, j))
+                    continue
+                counters.append(counter)
+                runs.append(k)
+                end = counter + self.num_k[k]
+            self.index[prefix] = (counters, runs)
+
+    def find(self, bid):
+        """
+        Return (k, j) if bid is ballot j of run k, or None if bid is not
+        in the manifest.  Takes time logarithmic in the number of runs.
+        """
+
+        if self.index == None:
+            self.build_index()
+        if bid in self.single_b:
+            return self.single_b[bid]
+        prefix, digits = split_id(bid)
+        if digits == "" or prefix not in self.index:
+            return None
+        value = int(digits)
+        counters, runs = self.index[prefix]
+        p = bisect.bisect_right(counters, value) - 1
+        if p < 0:
+            return None
+        k = runs[p]
+        j = value - counters[p]
+        if j < self.num_k[k] and \
+           utils.count_on_item(self.bid_k[k], self.num_k[k], j) == bid:
+            return k, j
+        return None
+
+    def attribute(self, k, j, attribute):
+        """ Return given attribute of ballot j of run k. """
+
+        value = self.value_ak[attribute][k]
+        if attribute in COUNTED_ATTRIBUTES:
+            return utils.count_on_item(value, self.num_k[k], j)
+        return value
+
+
+class BidList(collections.abc.Sequence):
+    """ Read-only list of the bids of a PbcManifest, in manifest order. """
+
+    def __init__(self, pbc_manifest):
+
+        self.manifest = pbc_manifest
+
+    def __len__(self):
+
+        return len(self.manifest)
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return [self.manifest.bid(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.manifest.bid(i)
+
+    def __iter__(self):
+
+        return self.manifest.iter_bids()
+
+    def __contains__(self, bid):
+
+        return self.manifest.find(bid) != None
+
+    def __eq__(self, other):
+
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+
+class AttributeView(collections.abc.Mapping):
+    """ Read-only mapping from the bids of a PbcManifest to one attribute. """
+
+    def __init__(self, pbc_manifest, attribute):
+
+        self.manifest = pbc_manifest
+        self.attribute = attribute
+
+    def __getitem__(self, bid):
+
+        location = self.manifest.find(bid)
+        if location == None:
+            raise KeyError(bid)
+        return self.manifest.attribute(*location, self.attribute)
+
+    def __iter__(self):
+
+        return self.manifest.iter_bids()
+
+    def __len__(self):
+
+        return len(self.manifest)
+
+
+def install(e, pbcid, pbc_manifest):
+    """
+    Make e.bids_p[pbcid] and e.boxid_pb[pbcid] etc. views of pbc_manifest.
+    """
+
+    e.manifest_p[pbcid] = pbc_manifest
+    e.bids_p[pbcid] = BidList(pbc_manifest)
+    e.boxid_pb[pbcid] = AttributeView(pbc_manifest, "boxid")
+    e.position_pb[pbcid] = AttributeView(pbc_manifest, "position")
+    e.stamp_pb[pbcid] = AttributeView(pbc_manifest, "stamp")
+    e.required_gid_pb[pbcid] = AttributeView(pbc_manifest, "required_gid")
+    e.possible_gid_pb[pbcid] = AttributeView(pbc_manifest, "possible_gid")
+    e.comments_pb[pbcid] = AttributeView(pbc_manifest, "comments")
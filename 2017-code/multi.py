@@ -247,8 +247,18 @@ class Election(object):
 
         # *** election data (manifests, reported votes, and reported outcomes)
 
+        e.input_cache = True
+        # if True, parsed reported CVRs and ballot manifests are cached
+        # next to their csv files (see input_cache.py)
+
         # *** Ballot manifests
 
+        e.manifest_p = {}
+        # pbcid->manifest.PbcManifest
+        # ballot manifest of pbcid, as runs (one per manifest row);
+        # e.bids_p[pbcid] and e.boxid_pb[pbcid] etc. are views of it
+        # (see manifest.py)
+
         e.bids_p = {}
         # input (21-reported-ballot-manifests/reported-ballot-manifest-PBCID.csv)
         # pbcid->[bids]
@@ -273,9 +283,9 @@ class Election(object):
         # from ballot manifest "Stamp" field (same as "imprint")
 
         # Note that the "Number of ballots" field of a ballot manifest
-        # is not captured here; we assume that any rows in an input
-        # manifest with "Number of ballots">1 is expanded into multiple rows
-        # first.
+        # is not captured here; a row with "Number of ballots">1 stands
+        # for that many ballots, with bids, positions, and stamps counting
+        # on from the row's (see utils.count_on and e.manifest_p).
 
         e.required_gid_pb = {}
         e.possible_gid_pb = {}
@@ -310,6 +320,19 @@ class Election(object):
         # not the count.  So e.votes_c[cid] is the domain for tallies of
         # contest cid.)
 
+        e.id_table_k = {}
+        # kind->interning.IdTable
+        # dense integer ids, and canonical objects, for the cids, pbcids,
+        # bids, selids, and votes of the election, assigned as data are
+        # read (see interning.py)
+
+        e.vote_index_c = {}
+        e.votes_list_c = {}
+        # Computed from e.votes_c (see strata.py)
+        # cid->vote->int  and  cid->[votes]
+        # stable map from votes to dense indices (and its inverse), giving
+        # the vote axes of the numpy arrays used by risk and planning code.
+
         # Computed from the above
 
         e.rn_cpr = {}
@@ -362,9 +385,10 @@ class Election(object):
 
         e.risk_method_m = {}
         # input (31-audit-spec/audit-spec-contest.csv)
-        # mid->{"Bayes", "Frequentist"}
+        # mid->{"Bayes", "BayesNormal", "Frequentist"}
         # The risk-measurement method used for a given measurement.
-        # Right now, the options are "Bayes" and "Frequentist", but this may
+        # Right now, the options are "Bayes", "BayesNormal" (the normal
+        # approximation of risk_normal.py), and "Frequentist", but this may
         # change.
         # dict mapping mids to strings
 
@@ -402,6 +426,55 @@ class Election(object):
         # pbcid->int
         # max number of ballots that can be audited per day in a pcb
 
+        e.planner = "fixed"
+        # planner used to compute the sample sizes for the next stage
+        # (see planner.compute_plan):
+        # "fixed", "optimize", "walk", or "surrogate"
+
+        e.plan_trials = 2000
+        # number of trials used to evaluate each candidate plan
+        # (by the "optimize" and "surrogate" planners)
+
+        e.plan_steps = 10
+        # initial step size, for the "optimize" planner, is
+        # 1/e.plan_steps of the max increment for a pbcid
+
+        e.plan_time_budget = 10.0
+        # max number of seconds the "optimize" or "walk" planner may run
+
+        e.surrogate_candidates = 2000
+        # number of candidate plans screened by the "surrogate" planner
+
+        e.surrogate_confirm = 5
+        # max number of the cheapest candidate plans that the "surrogate"
+        # planner checks by Monte Carlo (with e.plan_trials trials)
+
+        e.surrogate_kappa_tc = {}
+        # stage_time->cid->float
+        # factor by which the Gaussian surrogate (of the "surrogate"
+        # planner, and of the forecast) scales its standard deviations
+        # to match the Monte Carlo risk
+        # (see surrogate.ContestSurrogate.calibrate, planner.make_surrogate)
+
+        e.walk_schedule = "log"
+        # step-size schedule for the "walk" planner:
+        # "log", "sqrt", or "constant" (see planner.step_schedule)
+
+        e.walk_step_scale = 0.2
+        # initial step size, for the "walk" planner, as a fraction of
+        # the max increment for a pbcid
+
+        e.walk_steps_per_pbcid = 2000
+        # max number of steps of the "walk" planner, per pbcid planned
+
+        e.walk_window_per_pbcid = 200
+        # number of steps, per pbcid planned, in each window over which
+        # the "walk" planner's position is averaged
+
+        e.walk_tolerance = 0.01
+        # the "walk" planner has converged when the total increment
+        # averaged over a window changes by at most this fraction
+
         # *** Audit orders
 
         # TBD
@@ -425,6 +498,47 @@ class Election(object):
         e.n_trials = 100000
         # number of trials used to estimate risk in compute_contest_risk
 
+        e.n_trials_batch = 10000
+        # max number of trials whose posterior draws are made at once
+        # (as one trials x strata x votes array) in risk_bayes.compute_risk
+
+        e.n_jobs = 1
+        # number of worker processes used for parallel computations
+        # (e.g. computing risks of different measurements)
+
+        e.risk_seed_c = {}
+        # cid->int
+        # seed of the random number stream used to compute risks for cid
+        # (derived from e.audit_seed and cid; see risk_bayes.contest_seed)
+
+        e.adaptive_trials = False
+        # if True, risk_bayes.compute_risk runs trials in chunks and
+        # stops early (before e.n_trials) once the risk is clearly below
+        # the risk limit or clearly above the upset threshold
+
+        e.n_trials_chunk = 1000
+        # number of trials per chunk when e.adaptive_trials is True
+
+        e.adaptive_confidence = 0.99
+        # confidence level of the Wilson interval on the risk
+        # used to decide when to stop early
+
+        e.risk_cache_size = 1000
+        # max number of entries kept in the persistent cache of risk
+        # results (see risk_cache.py); 0 turns the cache off
+
+        e.forecast_scenarios = 0
+        # number of scenarios simulated, after each stage, to forecast
+        # the remaining workload of the audit (see forecast.py);
+        # 0 means no forecast
+
+        e.forecast_chunk = 250
+        # number of scenarios simulated together (as one set of arrays)
+        # by each forecast job
+
+        e.forecast_max_stages = 100
+        # max number of future stages simulated in each scenario
+
         e.shuffled_indices_p = {}
         e.shuffled_bids_p = {}
         # computed in audit_orders.py (but probably will be replaced)
@@ -464,6 +578,22 @@ class Election(object):
         # risk = probability that e.ro_c[e.cid[mid]] is wrong
         # dict mapping stage_time and mid to floats
 
+        e.risk_trials_tm = {}
+        # stage_time->measurement->int
+        # number of trials actually used to compute e.risk_tm
+        # (may be less than e.n_trials if e.adaptive_trials is True)
+
+        e.risk_interval_tm = {}
+        # stage_time->measurement->(float, float)
+        # Wilson interval (at confidence e.adaptive_confidence)
+        # for the risk in e.risk_tm
+
+        e.crn_gammas_tc = {}
+        # stage_time->cid->(alpha_sv, gammas_tsv)
+        # cached gamma variates for the current stage's posterior, used to
+        # evaluate sample-size tweaks with common random numbers
+        # (see risk_bayes.compute_risks_with_tweak)
+
         e.election_status_t = {}
         # stage_time->list of measurement statuses, at most once each
         # dict mapping stage_time to string
@@ -478,6 +608,15 @@ class Election(object):
         # cid->pbcid->bid->vote
         # (actual votes from sampled ballots)
 
+        e.audited_votes_read_p = {}
+        # pbcid->{"filename", "offset", "hash", "sha256", "check_sha256"}
+        # audited-votes file already read into e.av_cpb for pbcid, the
+        # byte offset read up to, the running SHA-256 hash (a hashlib
+        # object) and hex hash of the part read, and the hex hash of
+        # its last bytes (see audit.read_audited_votes)
+        # Not in the saved state (nor is e.av_cpb), so a new process
+        # (e.g. a new run of cli.py) reads the files in full.
+
         # computed from the above sample data
 
         e.sn_tcpra = {}
@@ -488,10 +627,29 @@ class Election(object):
         # sampled number stage_time->cid->pbcid->vote->count
         # sampled number by stage_time, contest, pbcid, and reported vote
 
+        e.strata_tc = {}
+        # stage_time->cid->strata.ContestStrata
+        # dense numpy arrays of sample counts, stratum sizes, and pseudocounts,
+        # compiled from e.sn_tcpra and e.rn_cpr once per stage (see strata.py);
+        # only the current stage's entry is kept
+
         # *** saved-state ***
         # see saved-state.py
         e.saved_state = {}
 
+        e.saved_state_in_memory = False
+        # if True, saved states are kept in e.saved_state_t rather than
+        # written to files (see audit.audit_headless)
+
+        e.saved_state_t = {}
+        # stage_time->saved state
+        # saved states kept in memory, if e.saved_state_in_memory is True
+
+        e.audit_files = True
+        # if False, the audit reads no audit spec or audited votes from
+        # files (they must already be in e, e.g. as generated by syn2
+        # for batch.py) and writes no audit output files
+
 
 def main():
 
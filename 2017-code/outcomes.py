@@ -14,7 +14,10 @@ An outcome is always a *tuple* of ids, even if there is only one winner.
 # TBD: Tie-breaking, etc.
 
 
+import numpy as np
+
 import ids
+import utils
 
 
 def compute_tally(vec):
@@ -52,6 +55,66 @@ def plurality(e, cid, tally):
     return max_vote
 
 
+def plurality_valid_mask(votes):
+    """
+    Return boolean numpy array, parallel to list votes, that is True
+    exactly for the votes that can win a plurality contest: votes with
+    a single selid that is not an error selid.
+    (Same test as used in plurality().)
+    """
+
+    return np.array([len(vote) == 1 and not ids.is_error_selid(vote[0])
+                     for vote in votes], dtype=bool)
+
+
+def plurality_batch(tally_tv, valid_v):
+    """
+    Batch version of plurality().
+
+    Here tally_tv is a numpy array of shape (trials, votes) giving one
+    tally per trial, and valid_v is a boolean mask over votes (as from
+    plurality_valid_mask).  Return integer numpy array giving, for each
+    trial, the index of the winning vote.  Ties are broken
+    deterministically, in favor of the vote with the smallest index.
+    An Exception is raised if no vote is valid.
+    """
+
+    if not np.any(valid_v):
+        raise ValueError("No winner allowed in plurality contest.")
+    masked_tv = np.where(valid_v, tally_tv, -np.inf)
+    return np.argmax(masked_tv, axis=1)
+
+
+def compute_outcome_batch(e, cid, votes, tally_tv, valid_v=None):
+    """
+    Return outcome for each of a batch of tallies for the given contest,
+    as an integer array of indices into votes (one per trial).
+
+    Here votes is the list of votes for the columns of tally_tv, an
+    array of shape (trials, votes).  For a plurality contest, valid_v
+    may be given as a precomputed plurality_valid_mask(votes).
+    """
+
+    return outcome_batch(e.contest_type_c[cid], votes, tally_tv, valid_v)
+
+
+def outcome_batch(contest_type, votes, tally_tv, valid_v=None):
+    """
+    Same as compute_outcome_batch, but given the contest type rather
+    than an Election and cid (so it can be used in worker processes
+    that don't have the Election).
+    """
+
+    if contest_type.lower()=="plurality":
+        if valid_v is None:
+            valid_v = plurality_valid_mask(votes)
+        return plurality_batch(tally_tv, valid_v)
+    else:
+        # TBD: IRV, etc...
+        utils.myerror("Non-plurality outcome rule {} not yet implemented!"
+                      .format(contest_type))
+
+
 def compute_ro_c(e):
     """ 
     Compute reported outcomes ro_c for each cid, from e.rn_cr. 
@@ -84,15 +147,67 @@ def compute_tally2(vec):
     Return dict giving mapping from rv to dict
     giving tally of av's that appear with that rv.
     (Used for comparison audits.)
+    Done in one pass over vec; rv's and av's appear in the dicts
+    in order of first appearance in vec.
     """
 
     tally2 = {}
     for (av, rv) in vec:
-        if rv not in tally2:
-            tally2[rv] = compute_tally([aa for (aa, rr)
-                                        in vec if rv == rr])
+        tally = tally2.setdefault(rv, {})
+        tally[av] = tally.get(av, 0) + 1
     return tally2
 
 
+def first_appearance_ids(x_ids):
+    """
+    Return (ids, index): the distinct ids in numpy integer array x_ids,
+    in order of first appearance, and for each element of x_ids the
+    index in ids of its id.
+    """
+
+    ids_sorted, first, inverse = np.unique(x_ids, return_index=True,
+                                           return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return ids_sorted[order], rank[inverse.reshape(-1)]
+
 
+def cross_tab_ids(av_ids, rv_ids):
+    """
+    Cross-tabulate parallel numpy integer arrays av_ids and rv_ids
+    (ids of actual and reported votes, as from interning).
+    Return (rv_id_k, av_id_k, count_k): numpy arrays giving, for each
+    distinct (rv id, av id) pair k, in order of first appearance, the
+    pair and the number of positions at which it appears.
+    Vectorized: pairs are combined into single integer keys, and
+    counted with np.bincount.
+    """
+
+    av_ids = np.asarray(av_ids, dtype=np.int64)
+    rv_ids = np.asarray(rv_ids, dtype=np.int64)
+    if len(rv_ids) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    n_a = int(av_ids.max()) + 1
+    key_k, k_index = first_appearance_ids(rv_ids * n_a + av_ids)
+    count_k = np.bincount(k_index, minlength=len(key_k))
+    return key_k // n_a, key_k % n_a, count_k
 
+
+def compute_tally2_ids(av_ids, rv_ids, vote_table):
+    """
+    Same as compute_tally2, for votes given by their ids in vote_table
+    (an interning.IdTable): av_ids and rv_ids are parallel sequences
+    of actual and reported vote ids.
+    """
+
+    rv_id_k, av_id_k, count_k = cross_tab_ids(av_ids, rv_ids)
+    tally2 = {}
+    # a pair first appears no earlier than its rv, so rv's and av's
+    # come out in the same order as from compute_tally2
+    for (rv_id, av_id, count) in zip(rv_id_k.tolist(), av_id_k.tolist(),
+                                     count_k.tolist()):
+        tally = tally2.setdefault(vote_table.value(rv_id), {})
+        tally[vote_table.value(av_id)] = count
+    return tally2
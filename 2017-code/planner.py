@@ -8,13 +8,57 @@ Routines to work with multi.py on post-election audits.
 Specifically, to produce an "audit plan" for the next stage,
 given what has been done already, and the results obtained
 from the previous stage.
+
+Four planners are available, selected by e.planner:
+
+    "fixed"      increase the sample of every pbcid touching an Open
+                 measurement by its max audit rate (compute_plan_fixed)
+    "optimize"   search for the smallest increments that bring every
+                 Open Active measurement under its risk limit
+                 (compute_plan_optimize)
+    "walk"       the same goal, by a random walk driven by single-trial
+                 outcomes (compute_plan_walk); scales to many pbcids
+    "surrogate"  the same goal, by screening many candidate plans with
+                 a Gaussian surrogate risk model (see surrogate.py) and
+                 confirming the best few by Monte Carlo
+                 (compute_plan_surrogate)
 """
 
+import time
+
+import numpy as np
+
+import audit
+import audit_orders
+import risk_bayes
+import strata
+import surrogate
+import utils
+
 
 ##############################################################################
 # Compute audit plan for next stage
 
 def compute_plan(e):
+    """ 
+    Compute a sampling plan for the next stage.
+    Put in e.plan_tp[e.stage_time] a dict of target sample sizes 
+    keyed by pbcid, using the planner named by e.planner.
+    """
+
+    if e.planner == "optimize":
+        compute_plan_optimize(e)
+    elif e.planner == "walk":
+        compute_plan_walk(e)
+    elif e.planner == "surrogate":
+        compute_plan_surrogate(e)
+    elif e.planner == "fixed":
+        compute_plan_fixed(e)
+    else:
+        utils.myerror("Unknown planner `{}`.".format(e.planner))
+
+
+def compute_plan_fixed(e):
     """ 
     Compute a sampling plan for the next stage.
     Put in e.plan_tp[e.stage_time] a dict of target sample sizes 
@@ -42,3 +86,519 @@ def compute_plan(e):
     return
 
 
+##############################################################################
+# Optimizing planner
+# Greedy marginal search in "tweak space" (sample-size increments per
+# pbcid).  Starting from no increments, each round tries increasing each
+# useful pbcid by one step, and keeps the candidate that most reduces
+# the total excess risk (sum over the target measurements of the amount
+# by which the risk exceeds the risk limit) per ballot added.
+# Risks are evaluated with common random numbers (see
+# risk_bayes.compute_risks_with_tweak), so that candidates are compared
+# on the same posterior draws; the candidates of a round are evaluated
+# in parallel by e.n_jobs worker processes, each of which draws the
+# (identical) gamma variates once, when it starts.
+
+def target_mids(e):
+    """ Return list of mids the plan should bring under their risk limits. """
+
+    return [mid for mid in e.mids
+            if e.status_tm[e.stage_time][mid] == "Open" and
+            e.sampling_mode_m[mid] == "Active"]
+
+
+def plan_bounds(e):
+    """
+    Return dict mapping pbcids to the most their sample sizes may be
+    increased in the next stage: the max audit rate, but no more than
+    the number of unsampled ballots (see risk_bayes.compute_slack_p).
+    """
+
+    slack_p = risk_bayes.compute_slack_p(e)
+    return {pbcid: max(0, min(slack_p[pbcid], int(e.max_audit_rate_p[pbcid])))
+            for pbcid in e.pbcids}
+
+
+def set_plan(e, tweak_p):
+    """ Put in e.plan_tp[e.stage_time] the sample sizes increased by tweak_p. """
+
+    e.plan_tp[e.stage_time] = e.sn_tp[e.stage_time].copy()
+    for pbcid in e.pbcids:
+        e.plan_tp[e.stage_time][pbcid] = \
+            min(e.sn_tp[e.stage_time][pbcid] + tweak_p[pbcid],
+                e.rn_p[pbcid])
+
+
+def make_plan_problem(e, mids, trials):
+    """
+    Return dict describing the risk evaluations needed to plan for mids:
+    for each cid measured by mids, its strata, contest type, reported
+    outcome index, and random-stream seed; and the number of trials.
+    (Picklable, so it can be sent to worker processes.)
+    """
+
+    contests = {}
+    for mid in mids:
+        cid = e.cid_m[mid]
+        cs = strata.get_strata(e, cid)
+        contests[cid] = {"strata": cs,
+                         "contest_type": e.contest_type_c[cid],
+                         "ro_index": risk_bayes.reported_outcome_index(e, cid, cs),
+                         "rs": risk_bayes.contest_seed(e, cid)}
+    return {"contests": contests, "trials": trials}
+
+
+plan_problem = None
+plan_gammas_c = None
+# set by init_plan_worker, in each worker process (or in this process)
+
+
+def init_plan_worker(problem):
+    """ Draw gamma variates for each contest of plan problem. """
+
+    global plan_problem, plan_gammas_c
+    plan_problem = problem
+    plan_gammas_c = {}
+    for cid, contest in problem["contests"].items():
+        plan_gammas_c[cid] = risk_bayes.draw_crn_gammas(contest["strata"],
+                                                        contest["contest_type"],
+                                                        contest["rs"],
+                                                        problem["trials"])
+
+
+def evaluate_candidate(candidate):
+    """
+    Given candidate (tweak_p, cids), return dict mapping each cid in cids
+    to its risk if sample sizes were increased by tweak_p.
+    """
+
+    tweak_p, cids = candidate
+    risk_c = {}
+    for cid in cids:
+        contest = plan_problem["contests"][cid]
+        alpha_sv, gammas_tsv = plan_gammas_c[cid]
+        risk_c[cid] = risk_bayes.crn_risk(contest["strata"],
+                                          contest["contest_type"],
+                                          contest["ro_index"],
+                                          alpha_sv, gammas_tsv, tweak_p,
+                                          contest["rs"])
+    return risk_c
+
+
+def excess_risk(e, mids, risk_c):
+    """
+    Return total amount by which risks (given by cid) of mids exceed
+    their risk limits.
+    """
+
+    return sum([max(0.0, risk_c[e.cid_m[mid]] - e.risk_limit_m[mid])
+                for mid in mids])
+
+
+def compute_plan_optimize(e):
+    """
+    Compute a sampling plan for the next stage, by greedy search for
+    the smallest increments (within the max audit rates and the
+    unsampled ballots) bringing every Open Active measurement under
+    its risk limit.  Put in e.plan_tp[e.stage_time] a dict of target
+    sample sizes keyed by pbcid.
+
+    The search stops when the target is met, when no increment can
+    help, or when e.plan_time_budget seconds have elapsed.  Once the
+    target is met, ballots are given back (in smaller and smaller
+    steps) as long as it stays met, while time remains.  If the
+    target is not met, the pbcids of contests still over their risk
+    limits get their full max audit rate (as in compute_plan_fixed).
+    """
+
+    start_time = time.monotonic()
+    mids = target_mids(e)
+    cids = sorted(set([e.cid_m[mid] for mid in mids]))
+    bound_p = plan_bounds(e)
+    step_p = {pbcid: max(1, int(np.ceil(bound_p[pbcid] / e.plan_steps)))
+              for pbcid in e.pbcids}
+    pbcids = sorted(set([pbcid for cid in cids
+                         for pbcid in e.possible_pbcid_c[cid]
+                         if bound_p[pbcid] > 0]))
+    cids_p = {pbcid: [cid for cid in cids if pbcid in e.possible_pbcid_c[cid]]
+              for pbcid in pbcids}
+
+    tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+    n_evaluations = 0
+    pool = utils.make_pool(e.n_jobs, init_plan_worker,
+                           (make_plan_problem(e, mids, e.plan_trials),))
+    try:
+        risk_c = utils.pool_map(pool, evaluate_candidate, [(tweak_p, cids)])[0]
+        excess = excess_risk(e, mids, risk_c)
+        while excess > 0 and \
+              time.monotonic() - start_time < e.plan_time_budget:
+            candidates = []
+            for pbcid in pbcids:
+                if tweak_p[pbcid] < bound_p[pbcid]:
+                    new_tweak_p = dict(tweak_p)
+                    new_tweak_p[pbcid] = min(bound_p[pbcid],
+                                             tweak_p[pbcid] + step_p[pbcid])
+                    candidates.append((pbcid, new_tweak_p))
+            if len(candidates) == 0:
+                break
+            results = utils.pool_map(pool, evaluate_candidate,
+                                     [(new_tweak_p, cids_p[pbcid])
+                                      for pbcid, new_tweak_p in candidates])
+            n_evaluations += len(candidates)
+            best = None
+            for (pbcid, new_tweak_p), new_risk_c in zip(candidates, results):
+                new_risk_c = dict(risk_c, **new_risk_c)
+                new_excess = excess_risk(e, mids, new_risk_c)
+                gain = (excess - new_excess) / \
+                       (new_tweak_p[pbcid] - tweak_p[pbcid])
+                if best == None or gain > best[0]:
+                    best = (gain, new_tweak_p, new_risk_c, new_excess)
+            if best[0] > 0:
+                _, tweak_p, risk_c, excess = best
+            elif all([step_p[pbcid] >= bound_p[pbcid] for pbcid in pbcids]):
+                break
+            else:
+                # no single step helps; try bigger steps
+                for pbcid in pbcids:
+                    step_p[pbcid] = min(bound_p[pbcid], 2 * step_p[pbcid])
+        # refine: give back ballots, with ever smaller steps,
+        # as long as the target stays met
+        reduced = False
+        while excess <= 0 and \
+              (reduced or any([step_p[pbcid] > 1 for pbcid in pbcids])) and \
+              time.monotonic() - start_time < e.plan_time_budget:
+            if not reduced:
+                for pbcid in pbcids:
+                    step_p[pbcid] = max(1, step_p[pbcid] // 2)
+            candidates = []
+            for pbcid in pbcids:
+                if tweak_p[pbcid] >= step_p[pbcid]:
+                    new_tweak_p = dict(tweak_p)
+                    new_tweak_p[pbcid] = tweak_p[pbcid] - step_p[pbcid]
+                    candidates.append((pbcid, new_tweak_p))
+            results = utils.pool_map(pool, evaluate_candidate,
+                                     [(new_tweak_p, cids_p[pbcid])
+                                      for pbcid, new_tweak_p in candidates])
+            n_evaluations += len(candidates)
+            reduced = False
+            for (pbcid, new_tweak_p), new_risk_c in zip(candidates, results):
+                new_risk_c = dict(risk_c, **new_risk_c)
+                if excess_risk(e, mids, new_risk_c) <= 0:
+                    tweak_p, risk_c = new_tweak_p, new_risk_c
+                    reduced = True
+                    break
+    finally:
+        utils.close_pool(pool)
+
+    if excess > 0:
+        for mid in mids:
+            cid = e.cid_m[mid]
+            if risk_c[cid] > e.risk_limit_m[mid]:
+                for pbcid in e.possible_pbcid_c[cid]:
+                    tweak_p[pbcid] = bound_p[pbcid]
+
+    set_plan(e, tweak_p)
+    utils.myprint("Planner: {} candidate plans evaluated in {:.1f} seconds;"
+                  " {} ballots added{}."
+                  .format(n_evaluations, time.monotonic() - start_time,
+                          sum(tweak_p.values()),
+                          "" if excess <= 0 else
+                          " (risk limits not reached; using max audit rates)"))
+
+
+##############################################################################
+# Random-walk planner
+# Productized from opt/test2.py.  The walk moves one pbcid's increment
+# at a time, driven by the outcome of a single trial: if the simulated
+# outcome of the contest is wrong (a "failure"), the increment goes up
+# by (1 - risk_limit) times the step size; otherwise it goes down by
+# risk_limit times the step size.  So the walk drifts to where the
+# chance of failure equals the risk limit.  (opt/test2.py instead moved
+# down a full step with probability risk_limit / (1 - risk_limit); that
+# has the same drift, but only works for risk limits below 1/2.)
+# Each step costs just one trial for one measurement, so
+# the walk handles many (64 or more) pbcids, where searching over each
+# pbcid in turn becomes infeasible.
+#
+# Step sizes shrink with the number of sweeps (d steps, where d is the
+# number of pbcids being planned) according to e.walk_schedule.  Every
+# e.walk_window_per_pbcid sweeps, the average position over the window
+# is compared with that of the previous window; the walk has converged
+# when the total increment changes by at most a fraction
+# e.walk_tolerance.  The plan is the average position over the last
+# complete window (or the last position, if there is none).
+
+def plan_seed(e, planner_name):
+    """
+    Return seed for the named planner's random stream at the current
+    stage (derived from e.audit_seed and e.stage_time, so that runs
+    are reproducible).
+    """
+
+    if e.audit_seed == None:
+        return int(audit.auditRandomState.randint(2**31))
+    hash_input = bytearray(str(e.audit_seed)+","+planner_name+","+e.stage_time,
+                           'utf-8')
+    return audit_orders.sha256(hash_input)
+
+
+def step_schedule(schedule, sweep):
+    """
+    Return multiplier for the step size at given sweep (1, 2, ...),
+    for the named schedule:
+        "log"        1/log(sweep+1)  (as in opt/test2.py)
+        "sqrt"       1/sqrt(sweep)
+        "constant"   1
+    """
+
+    if schedule == "log":
+        return 1.0 / np.log(sweep + 1)
+    elif schedule == "sqrt":
+        return 1.0 / np.sqrt(sweep)
+    elif schedule == "constant":
+        return 1.0
+    utils.myerror("Unknown random-walk step schedule `{}`.".format(schedule))
+
+
+def compute_plan_walk(e):
+    """
+    Compute a sampling plan for the next stage by a random walk in tweak
+    space (see above), aiming for the smallest increments (within the
+    max audit rates and the unsampled ballots) at which every Open
+    Active measurement has risk at most its risk limit.
+    Put in e.plan_tp[e.stage_time] a dict of target sample sizes keyed
+    by pbcid.
+
+    The walk starts halfway between no increment and the max increment
+    for each pbcid, and stops when it has converged, after
+    e.walk_steps_per_pbcid steps per pbcid, or after
+    e.plan_time_budget seconds.
+    """
+
+    start_time = time.monotonic()
+    mids = target_mids(e)
+    bound_p = plan_bounds(e)
+    pbcids = sorted(set([pbcid for mid in mids
+                         for pbcid in e.possible_pbcid_c[e.cid_m[mid]]
+                         if bound_p[pbcid] > 0]))
+    if len(pbcids) == 0:
+        set_plan(e, {pbcid: 0 for pbcid in e.pbcids})
+        return
+    mids_p = {pbcid: [mid for mid in mids
+                      if pbcid in e.possible_pbcid_c[e.cid_m[mid]]]
+              for pbcid in pbcids}
+    slack_p = risk_bayes.compute_slack_p(e)
+    rs = utils.RandomState(plan_seed(e, "walk"))
+
+    d = len(pbcids)
+    bound_i = np.array([bound_p[pbcid] for pbcid in pbcids], dtype=float)
+    x_i = bound_i / 2.0
+    window = e.walk_window_per_pbcid * d
+    window_sum_i = np.zeros(d)
+    plan_i = None
+    converged = False
+    tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+    step = 0
+    while step < e.walk_steps_per_pbcid * d and \
+          time.monotonic() - start_time < e.plan_time_budget:
+        step += 1
+        i = rs.randint(d)
+        pbcid = pbcids[i]
+        mid = mids_p[pbcid][rs.randint(len(mids_p[pbcid]))]
+        for j in range(d):
+            tweak_p[pbcids[j]] = int(round(x_i[j]))
+        failure = risk_bayes.compute_risks_with_tweak(e, slack_p, tweak_p, 1,
+                                                      mids=[mid], rs=rs)[mid] > 0
+        step_size = e.walk_step_scale * bound_i[i] * \
+                    step_schedule(e.walk_schedule, 1 + (step - 1) // d)
+        risk_limit = e.risk_limit_m[mid]
+        if failure:
+            x_i[i] = min(bound_i[i], x_i[i] + (1 - risk_limit) * step_size)
+        else:
+            x_i[i] = max(0.0, x_i[i] - risk_limit * step_size)
+        window_sum_i += x_i
+        if step % window == 0:
+            window_mean_i = window_sum_i / window
+            window_sum_i = np.zeros(d)
+            if plan_i is not None and \
+               abs(window_mean_i.sum() - plan_i.sum()) <= \
+               e.walk_tolerance * max(1.0, plan_i.sum()):
+                converged = True
+            plan_i = window_mean_i
+            if converged:
+                break
+    if plan_i is None:
+        plan_i = x_i
+
+    tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+    for j in range(d):
+        tweak_p[pbcids[j]] = int(min(bound_i[j], np.ceil(plan_i[j])))
+    set_plan(e, tweak_p)
+    utils.myprint("Planner: random walk of {} steps in {:.1f} seconds"
+                  " ({}converged); {} ballots added."
+                  .format(step, time.monotonic() - start_time,
+                          "" if converged else "not ",
+                          sum(tweak_p.values())))
+
+
+##############################################################################
+# Surrogate-screening planner
+# Candidate plans are screened with the Gaussian surrogate of
+# surrogate.py, recalibrated each stage so that it matches the Monte Carlo
+# risks just measured (e.risk_tm[e.stage_time]).  Candidates are generated
+# as random directions in tweak space (plus each single pbcid, and all
+# pbcids in proportion to their max increments); along each direction,
+# bisection on the surrogate finds the smallest multiple of the direction
+# meeting all risk limits.  The cheapest e.surrogate_confirm candidates
+# are then checked in order, by Monte Carlo with common random numbers,
+# and the first one confirmed is used.  If none is, the screening is
+# repeated (a few times) with targets tightened to 0.8 times as much.
+
+def make_surrogate(e, cid, mid, pbcids):
+    """
+    Return surrogate.ContestSurrogate for cid, calibrated against the
+    Monte Carlo risk of mid (measuring cid) in e.risk_tm[e.stage_time].
+    Calibration is done once per stage and contest: kappa is recorded
+    in e.surrogate_kappa_tc[e.stage_time], and reused from there.
+    """
+
+    cs = strata.get_strata(e, cid)
+    contest_surrogate = surrogate.ContestSurrogate(
+        cs, e.contest_type_c[cid],
+        risk_bayes.reported_outcome_index(e, cid, cs), pbcids)
+    kappa_c = e.surrogate_kappa_tc.get(e.stage_time, {})
+    if cid in kappa_c:
+        contest_surrogate.kappa = kappa_c[cid]
+    else:
+        kappa = contest_surrogate.calibrate(e.risk_tm[e.stage_time][mid])
+        utils.nested_set(e.surrogate_kappa_tc, [e.stage_time, cid], kappa)
+    return contest_surrogate
+
+
+def make_surrogates(e, mids, pbcids):
+    """
+    Return dict mapping the cids measured by mids to their calibrated
+    surrogate.ContestSurrogate (see make_surrogate).
+    """
+
+    surrogate_c = {}
+    for mid in mids:
+        cid = e.cid_m[mid]
+        if cid not in surrogate_c:
+            surrogate_c[cid] = make_surrogate(e, cid, mid, pbcids)
+    return surrogate_c
+
+
+def surrogate_feasible(e, mids, surrogate_c, tweak_cp, target_factor):
+    """
+    Return boolean array telling which rows of tweak_cp bring the
+    surrogate risk of every mid in mids to at most target_factor
+    times its risk limit.
+    """
+
+    risk_c = {cid: surrogate_c[cid].risk(tweak_cp) for cid in surrogate_c}
+    feasible_c = np.ones(tweak_cp.shape[0], dtype=bool)
+    for mid in mids:
+        feasible_c &= risk_c[e.cid_m[mid]] <= target_factor * e.risk_limit_m[mid]
+    return feasible_c
+
+
+def screen_candidates(e, mids, surrogate_c, direction_ci, bound_i,
+                      target_factor):
+    """
+    Return array of candidate plans (rows of increments, one per row of
+    direction_ci along which target_factor times the risk limits can be
+    met, by the surrogate), each the smallest multiple of its direction
+    meeting the target, sorted cheapest first.
+    """
+
+    feasible_c = surrogate_feasible(e, mids, surrogate_c, direction_ci,
+                                    target_factor)
+    lo_c = np.zeros(len(direction_ci))
+    hi_c = np.ones(len(direction_ci))
+    for _ in range(30):
+        t_c = (lo_c + hi_c) / 2
+        ok_c = surrogate_feasible(e, mids, surrogate_c,
+                                  direction_ci * t_c[:, None], target_factor)
+        hi_c = np.where(ok_c, t_c, hi_c)
+        lo_c = np.where(ok_c, lo_c, t_c)
+    candidate_ci = np.minimum(bound_i,
+                              np.ceil(direction_ci * hi_c[:, None]))[feasible_c]
+    return candidate_ci[np.argsort(candidate_ci.sum(axis=1), kind="stable")]
+
+
+def compute_plan_surrogate(e):
+    """
+    Compute a sampling plan for the next stage by screening
+    e.surrogate_candidates candidate plans with a Gaussian surrogate
+    risk model, and confirming the cheapest by Monte Carlo (see above).
+    Put in e.plan_tp[e.stage_time] a dict of target sample sizes keyed
+    by pbcid.
+
+    If no candidate is confirmed, the pbcids of contests still over
+    their risk limits get their full max audit rate (as in
+    compute_plan_fixed).
+    """
+
+    start_time = time.monotonic()
+    mids = target_mids(e)
+    bound_p = plan_bounds(e)
+    pbcids = sorted(set([pbcid for mid in mids
+                         for pbcid in e.possible_pbcid_c[e.cid_m[mid]]
+                         if bound_p[pbcid] > 0]))
+    tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+    if len(pbcids) == 0:
+        set_plan(e, tweak_p)
+        return
+    slack_p = risk_bayes.compute_slack_p(e)
+    surrogate_c = make_surrogates(e, mids, pbcids)
+    bound_i = np.array([bound_p[pbcid] for pbcid in pbcids], dtype=float)
+
+    # candidate directions, scaled so the largest possible multiple is 1
+    d = len(pbcids)
+    rs = utils.RandomState(plan_seed(e, "surrogate"))
+    n_random = max(0, e.surrogate_candidates - d - 1)
+    direction_ci = np.vstack([np.eye(d),
+                              np.ones((1, d)),
+                              rs.uniform(size=(n_random, d))])
+    direction_ci /= direction_ci.max(axis=1, keepdims=True)
+    direction_ci *= bound_i
+
+    # If Monte Carlo rejects the cheapest candidates (which the surrogate
+    # puts just at the risk limits), screen again for tighter targets.
+    confirmed = False
+    n_feasible = 0
+    n_confirmed = 0
+    target_factor = 1.0
+    for _ in range(4):
+        candidate_ci = screen_candidates(e, mids, surrogate_c, direction_ci,
+                                         bound_i, target_factor)
+        n_feasible = max(n_feasible, len(candidate_ci))
+        for c in range(min(e.surrogate_confirm, len(candidate_ci))):
+            for j in range(d):
+                tweak_p[pbcids[j]] = int(candidate_ci[c, j])
+            n_confirmed += 1
+            risk_m = risk_bayes.compute_risks_with_tweak(e, slack_p, tweak_p,
+                                                         e.plan_trials,
+                                                         crn=True, mids=mids)
+            if all([risk_m[mid] <= e.risk_limit_m[mid] for mid in mids]):
+                confirmed = True
+                break
+        if confirmed or len(candidate_ci) == 0:
+            break
+        target_factor *= 0.8
+
+    if not confirmed:
+        tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+        for mid in mids:
+            for pbcid in e.possible_pbcid_c[e.cid_m[mid]]:
+                tweak_p[pbcid] = bound_p[pbcid]
+    set_plan(e, tweak_p)
+    utils.myprint("Planner: {} of {} candidate plans feasible by surrogate,"
+                  " {} checked by Monte Carlo, in {:.1f} seconds; {} ballots"
+                  " added{}."
+                  .format(n_feasible, len(direction_ci),
+                          n_confirmed, time.monotonic() - start_time,
+                          sum(tweak_p.values()),
+                          "" if confirmed else
+                          " (none confirmed; using max audit rates)"))
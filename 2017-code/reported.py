@@ -40,6 +40,9 @@ import os
 import multi
 import csv_readers
 import ids
+import input_cache
+import interning
+import manifest
 import utils
 
 
@@ -61,82 +64,130 @@ def read_reported(e):
 
 def read_reported_ballot_manifests(e):
     """
-    Read ballot manifest file 21-reported-ballot-manifests and expand rows if needed.
+    Read ballot manifest file 21-reported-ballot-manifests.
+
+    Rows are kept as runs (see manifest.py) rather than expanded into
+    ballots; e.bids_p[pbcid], e.boxid_pb[pbcid], etc. are views of them.
+
+    Each pbcid's file is read by read_ballot_manifest_file, in a worker
+    process if e.n_jobs > 1; the results are merged into e in pbcid order.
     """
 
     election_pathname = os.path.join(multi.ELECTIONS_ROOT, e.election_dirname)
     specification_pathname = os.path.join(election_pathname,
                                           "2-reported",
                                           "21-reported-ballot-manifests")
-    fieldnames = ["Collection", "Box", "Position", "Stamp", 
-                  "Ballot id", "Number of ballots",
-                  "Required Contests", "Possible Contests", "Comments"]
+    jobs = []
     for pbcid in e.pbcids:
         safe_pbcid = ids.filename_safe(pbcid)
         filename = utils.greatest_name(specification_pathname,
                                        "manifest-" + safe_pbcid,
                                        ".csv")
-        file_pathname = os.path.join(specification_pathname, filename)
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=False)
-        for row in rows:
-            pbcid = row["Collection"]
-            boxid = row["Box"]
-            position = row["Position"]
-            stamp = row["Stamp"]
-            bid = row["Ballot id"]
-            try:
-                num = int(row["Number of ballots"])
-            except ValueError:
-                utils.myerror("Number {} of ballots not an integer.".format(num))
-            if num<=0:
-                utils.mywarning("Number {} of ballots not positive.".format(num))
-            req = row["Required Contests"]
-            poss = row["Possible Contests"]
-            comments = row["Comments"]
-
-            bids = utils.count_on(bid, num)
-            stamps = utils.count_on(stamp, num)
-            positions = utils.count_on(position, num)
-
-            for i in range(num):
-                # utils.nested_set(e.bids_p, [pbcid, bids[i]], True)
-                if pbcid not in e.bids_p:
-                    e.bids_p[pbcid] = []
-                e.bids_p[pbcid].append(bids[i])
-                utils.nested_set(e.boxid_pb, [pbcid, bids[i]], boxid)
-                utils.nested_set(e.position_pb, [pbcid, bids[i]], position[i])
-                utils.nested_set(e.stamp_pb, [pbcid, bids[i]], stamps[i])
-                utils.nested_set(e.required_gid_pb, [pbcid, bids[i]], req)
-                utils.nested_set(e.possible_gid_pb, [pbcid, bids[i]], poss)
-                utils.nested_set(e.comments_pb, [pbcid, bids[i]], comments)
-                          
+        jobs.append({"file_pathname": os.path.join(specification_pathname, filename),
+                     "use_cache": e.input_cache})
+    for runs_p in utils.parallel_map(read_ballot_manifest_file, jobs, e.n_jobs):
+        for pbcid in runs_p:
+            if pbcid not in e.manifest_p:
+                manifest.install(e, pbcid, manifest.PbcManifest())
+            e.manifest_p[pbcid].add_runs(runs_p[pbcid])
+
+
+def read_ballot_manifest_file(job):
+    """
+    Read one ballot manifest file, job["file_pathname"].
+    Return dict mapping each pbcid in the file to its runs (one per row,
+    not expanded), by column, as for manifest.PbcManifest.add_runs.
+    Repeated attribute values (e.g. box ids) are shared objects.
+    """
+
+    fieldnames = ["Collection", "Box", "Position", "Stamp", 
+                  "Ballot id", "Number of ballots",
+                  "Required Contests", "Possible Contests", "Comments"]
+    columns = [("bid", "Ballot id"),
+               ("boxid", "Box"),
+               ("position", "Position"),
+               ("stamp", "Stamp"),
+               ("required_gid", "Required Contests"),
+               ("possible_gid", "Possible Contests"),
+               ("comments", "Comments")]
+    shared = {}
+    runs_p = {}
+    rows = input_cache.iter_csv_file(job["file_pathname"], fieldnames,
+                                     varlen=False, use_cache=job["use_cache"])
+    for row in rows:
+        pbcid = row["Collection"]
+        try:
+            num = int(row["Number of ballots"])
+        except ValueError:
+            utils.myerror("Number {} of ballots not an integer."
+                          .format(row["Number of ballots"]))
+        if num<=0:
+            utils.mywarning("Number {} of ballots not positive.".format(num))
+            continue
+        if pbcid not in runs_p:
+            runs_p[pbcid] = {"num": []}
+            for (column, fieldname) in columns:
+                runs_p[pbcid][column] = []
+        runs = runs_p[pbcid]
+        runs["num"].append(num)
+        runs["bid"].append(row["Ballot id"])
+        for (column, fieldname) in columns[1:]:
+            runs[column].append(shared.setdefault(row[fieldname], row[fieldname]))
+    return runs_p
+
 
 def read_reported_cvrs(e):
     """
     Read reported votes 22-reported-cvrs/reported-cvrs-PBCID.csv.
+
+    Each pbcid's file is read by read_reported_cvr_file, in a worker
+    process if e.n_jobs > 1; the results are merged into e in pbcid order.
     """
 
     election_pathname = os.path.join(multi.ELECTIONS_ROOT, e.election_dirname)
     specification_pathname = os.path.join(election_pathname,
                                           "2-reported","22-reported-cvrs")
-    fieldnames = ["Collection", "Scanner", "Ballot id",
-                  "Contest", "Selections"]
+    jobs = []
     for pbcid in e.pbcids:
         safe_pbcid = ids.filename_safe(pbcid)
         filename = utils.greatest_name(specification_pathname,
                                        "reported-cvrs-" + safe_pbcid,
                                        ".csv")
-        file_pathname = os.path.join(specification_pathname, filename)
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
-        for row in rows:
-            pbcid = row["Collection"]
-            scanner = row["Scanner"]
-            bid = row["Ballot id"]
-            cid = row["Contest"]
-            vote = row["Selections"]
-            vote = tuple(sorted(vote))     # put vote selids into canonical order
-            utils.nested_set(e.rv_cpb, [cid, pbcid, bid], vote)
-            utils.nested_set(e.votes_c, [cid, vote], True)
+        jobs.append({"file_pathname": os.path.join(specification_pathname, filename),
+                     "use_cache": e.input_cache})
+    for rv_cpb in utils.parallel_map(read_reported_cvr_file, jobs, e.n_jobs):
+        for cid in rv_cpb:
+            for pbcid in rv_cpb[cid]:
+                rv_b = interning.intern_votes_b(e, rv_cpb[cid][pbcid])
+                if cid not in e.rv_cpb:
+                    e.rv_cpb[cid] = {}
+                if pbcid not in e.rv_cpb[cid]:
+                    e.rv_cpb[cid][pbcid] = {}
+                e.rv_cpb[cid][pbcid].update(rv_b)
+                for vote in rv_b.values():
+                    utils.nested_set(e.votes_c, [cid, vote], True)
+
+
+def read_reported_cvr_file(job):
+    """
+    Read one reported-CVR file, job["file_pathname"].
+    Return dict mapping cid->pbcid->bid->reported vote, for its rows.
+    """
+
+    fieldnames = ["Collection", "Scanner", "Ballot id",
+                  "Contest", "Selections"]
+    rv_cpb = {}
+    rows = input_cache.iter_csv_file(job["file_pathname"], fieldnames,
+                                     varlen=True, use_cache=job["use_cache"])
+    for row in rows:
+        pbcid = row["Collection"]
+        scanner = row["Scanner"]
+        bid = row["Ballot id"]
+        cid = row["Contest"]
+        vote = row["Selections"]
+        vote = tuple(sorted(vote))     # put vote selids into canonical order
+        utils.nested_set(rv_cpb, [cid, pbcid, bid], vote)
+    return rv_cpb
 
 
 def read_reported_outcomes(e):
@@ -156,72 +207,78 @@ def read_reported_outcomes(e):
         utils.nested_set(e.ro_c, [cid], winners)
 
 
-def check_reported_selids(e):
-    
-    # make sure e.selids_c[cid] contains all +/- selids seen in reported votes
-    # and that e.votes_c[cid] contains all reported votes
-    for cid in e.cids:
-        for pbcid in e.possible_pbcid_c[cid]:
-            for bid in e.bids_p[pbcid]:
-                if bid in e.rv_cpb[cid][pbcid]:
-                    rv = e.rv_cpb[cid][pbcid][bid]
-                else:
-                    rv = ("-NoSuchContest",)
-                utils.nested_set(e.votes_c, [cid, rv], True)
-                for selid in rv:
-                    if ids.is_writein(selid) or ids.is_error_selid(selid):
-                        e.selids_c[cid][selid] = True
-
-def compute_rn_cpr(e):
-    """ Set e.rn_cpr[cid][pbcid][rv] to number in pbcid with reported vote rv. """
+def compute_reported_counts(e, add_seen_votes=False):
+    """
+    Compute e.rn_cpr, e.rn_c, e.rn_p, and e.rn_cr in one pass over the
+    reported votes e.rv_cpb (one CVR row per ballot and contest), taking
+    time linear in the number of rows (not in contests x ballots):
+
+    e.rn_cpr[cid][pbcid][rv]  number in pbcid with reported vote rv in cid
+    e.rn_c[cid]               number of reported votes cast in contest cid
+    e.rn_p[pbcid]             number of reported votes cast in pbcid
+    e.rn_cr[cid][rv]          number cast for reported vote rv in cid
+
+    Only ballots in the ballot manifest (e.bids_p) of a pbcid in
+    e.possible_pbcid_c[cid] are counted.
+
+    If add_seen_votes is True, also make sure e.votes_c[cid] contains
+    all reported votes (and ("-NoSuchContest",) if some ballot in a pbcid
+    has no reported vote for cid), and that e.selids_c[cid] contains all
+    +/- selids seen in them.  New votes are added in the order of the
+    reported votes of each pbcid (i.e., CVR order), then
+    ("-NoSuchContest",) if needed for that pbcid.
+    """
 
+    no_such_contest = ("-NoSuchContest",)
+    bids_in_manifest_p = {}
+    # pbcid->container of its manifest bids, for "bid in" tests
+    count_cpr = {}
     for cid in e.cids:
-        e.rn_cpr[cid] = {}
+        count_cpr[cid] = {}
+        seen_r = {}
         for pbcid in e.possible_pbcid_c[cid]:
-            e.rn_cpr[cid][pbcid] = {}
-            for rv in e.votes_c[cid]:
-                e.rn_cpr[cid][pbcid][rv] = len([bid for bid in e.bids_p[pbcid]
-                                                if bid in e.rv_cpb[cid][pbcid] and \
-                                                e.rv_cpb[cid][pbcid][bid] == rv])
-
-
-def compute_rn_c(e):    
-    """ 
-    Compute e.rn_c[cid] as number of reported votes cast in contest cid. 
-
-    (From e.rn_cpr)
-    """
-    
-    for cid in e.cids:
-        e.rn_c[cid] = sum([e.rn_cpr[cid][pbcid][rv]
-                           for pbcid in e.rn_cpr[cid]
-                           for rv in e.votes_c[cid]])
-
-
-def compute_rn_p(e):
-    """ Compute e.rn_p[pbcid] as number of reported votes cast in collection pbcid. """
-
+            if pbcid not in bids_in_manifest_p:
+                bids = e.bids_p.get(pbcid, [])
+                if not isinstance(bids, manifest.BidList):
+                    bids = set(bids)
+                bids_in_manifest_p[pbcid] = bids
+            bids = bids_in_manifest_p[pbcid]
+            count_r = {}
+            n_counted = 0
+            for (bid, rv) in e.rv_cpb.get(cid, {}).get(pbcid, {}).items():
+                if bid in bids:
+                    count_r[rv] = count_r.get(rv, 0) + 1
+                    n_counted += 1
+            count_cpr[cid][pbcid] = count_r
+            if add_seen_votes:
+                new_rvs = list(count_r)
+                if n_counted < len(bids):
+                    new_rvs.append(no_such_contest)
+                for rv in new_rvs:
+                    if rv not in seen_r:
+                        seen_r[rv] = True
+                        utils.nested_set(e.votes_c, [cid, rv], True)
+                        for selid in rv:
+                            if ids.is_writein(selid) or ids.is_error_selid(selid):
+                                e.selids_c[cid][selid] = True
+
+    # fill in the tallies (including zero counts) from the pass above
     for pbcid in e.pbcids:
-        e.rn_p[pbcid] = sum([e.rn_cpr[cid][pbcid][rv]
-                             for cid in e.rn_cpr
-                             for rv in e.votes_c[cid]])        
-
-
-def compute_rn_cr(e):
-    """ 
-    Compute  e.rn_cr[cid][rv] as reported number cast for 
-    reported vote rv in cid. 
-    """
-    
+        e.rn_p[pbcid] = 0
     for cid in e.cids:
+        e.rn_cpr[cid] = {}
         e.rn_cr[cid] = {}
-        for pbcid in e.rn_cpr[cid]:
-            for rv in e.votes_c[cid]:
-                if rv not in e.rn_cr[cid]:
-                    e.rn_cr[cid][rv] = 0
-                if rv not in e.rn_cpr[cid][pbcid]:
-                    e.rn_cpr[cid][pbcid][rv] = 0
-                e.rn_cr[cid][rv] += e.rn_cpr[cid][pbcid][rv]
+        if len(count_cpr[cid]) > 0:
+            e.rn_cr[cid] = {rv: 0 for rv in e.votes_c[cid]}
+        e.rn_c[cid] = 0
+        for (pbcid, count_r) in count_cpr[cid].items():
+            e.rn_cpr[cid][pbcid] = {rv: count_r.get(rv, 0)
+                                    for rv in e.votes_c[cid]}
+            for (rv, count) in count_r.items():
+                if rv in e.rn_cr[cid]:
+                    e.rn_cr[cid][rv] += count
+                    e.rn_c[cid] += count
+                    e.rn_p[pbcid] += count
 
 
 def finish_reported(e):
@@ -230,12 +287,7 @@ def finish_reported(e):
     or that need conversion (e.g. strings-->tuples from json keys).
     """
 
-    check_reported_selids(e)
-
-    compute_rn_cpr(e)
-    compute_rn_c(e)    
-    compute_rn_p(e)
-    compute_rn_cr(e)
+    compute_reported_counts(e, add_seen_votes=True)
 
 
 def check_reported(e):
@@ -325,7 +377,7 @@ def check_reported(e):
     for pbcid in e.pbcids:
         # if not isinstance(e.bids_p[pbcid], dict):
         #     utils.myerror("e.bids_p[{}] is not a dict.".format(pbcid))
-        if not isinstance(e.bids_p[pbcid], list):
+        if not isinstance(e.bids_p[pbcid], (list, manifest.BidList)):
             utils.myerror("e.bids_p[{}] is not a list.".format(pbcid))
 
     if not isinstance(e.rv_cpb, dict):
@@ -15,12 +15,17 @@ a significant change to the code base.  (Some thoughts, albeit
 primitive, are sketched in risk_bayes_2.py.)
 """
 
-import copy
 import numpy as np
+import statistics
 
 import multi
 import audit
+import audit_orders
 import outcomes
+import risk_cache
+import risk_normal
+import strata
+import utils
 
 ##############################################################################
 # Gamma distribution
@@ -62,10 +67,226 @@ def dirichlet(tally):
     return dir
 
 
+def dirichlet_batch(alpha_sv, trials, rs=None):
+    """
+    Batched version of dirichlet().
+
+    Here alpha_sv is a numpy array of shape (strata, votes) giving,
+    for each stratum, the Dirichlet hyperparameters for the votes.
+    Return numpy array of shape (trials, strata, votes), where each
+    row [trial, stratum, :] is a Dirichlet sample for that stratum,
+    summing to one.  As with gamma(), hyperparameters of zero are
+    allowed, and yield components that are always zero.
+
+    All gamma variates for all trials are drawn with a single call.
+    Parameter rs, if present, is a numpy.random.RandomState object;
+    otherwise audit.auditRandomState is used, so results are
+    reproducible from the audit seed.
+    """
+
+    if rs == None:
+        rs = audit.auditRandomState
+    alpha_sv = np.asarray(alpha_sv, dtype=float)
+    gammas_tsv = rs.gamma(alpha_sv, size=(trials,)+alpha_sv.shape)
+    totals_ts = gammas_tsv.sum(axis=2, keepdims=True)
+    return gammas_tsv / totals_ts
+
+
 ##############################################################################
 # Risk measurement (Bayes risk)
 
-def compute_risk(e, mid, sn_tcpra, trials=None):
+def draw_test_tallies(alpha_sv, nonsample_s, trials, rs=None):
+    """
+    Return (trials, votes) array of simulated final tallies for a contest.
+
+    Each trial draws a Dirichlet sample for every stratum, scales it by
+    the stratum's nonsample size, and sums across strata.  As in the
+    original per-trial loop, the hyperparameters themselves (sample counts
+    plus pseudocounts) are also added in to each simulated tally.
+    """
+
+    base_v = alpha_sv.sum(axis=0)
+    dirichlet_tsv = dirichlet_batch(alpha_sv, trials, rs)
+    return base_v + np.einsum("tsv,s->tv", dirichlet_tsv, nonsample_s)
+
+
+def reported_outcome_index(e, cid, cs):
+    """
+    Return index of reported outcome e.ro_c[cid] in cs.votes,
+    or -1 if it is not there (so it never matches any simulated outcome).
+    """
+
+    if e.ro_c[cid] in cs.votes:
+        return cs.votes.index(e.ro_c[cid])
+    return -1
+
+
+def lumped_index(index, lump_v):
+    """
+    Return index of vote among lumped votes (see strata.ContestStrata.lumping),
+    given its index among all votes; -1 stays -1.
+    """
+
+    if index < 0:
+        return index
+    return int(lump_v[index])
+
+
+def wilson_interval(k, n, confidence):
+    """
+    Return Wilson score interval (lo, hi) for a binomial proportion,
+    given k successes in n trials, at given confidence level
+    (e.g. 0.99).
+    """
+
+    if n == 0:
+        return (0.0, 1.0)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    phat = k / n
+    denominator = 1.0 + z * z / n
+    center = (phat + z * z / (2 * n)) / denominator
+    halfwidth = z * np.sqrt(phat * (1 - phat) / n + z * z / (4 * n * n)) \
+                / denominator
+    return (max(0.0, center - halfwidth), min(1.0, center + halfwidth))
+
+
+##############################################################################
+# Random number streams
+# Each contest gets its own RandomState, seeded (using SHA256, as for
+# the audit orders) from the audit seed and its cid.  So a contest's
+# risks do not depend on what other contests were computed, in what
+# order, or in what process; this is what allows compute_risks to farm
+# contests out to worker processes.  All measurements on a contest
+# share its posterior draws (see compute_risks).
+
+def contest_seed(e, cid):
+    """
+    Return seed (a nonnegative integer) for the random number stream
+    used to compute risks for contest cid.
+
+    If e.audit_seed is None, the seed is instead drawn (once per cid)
+    from audit.auditRandomState, which is then itself unseeded.
+    """
+
+    if cid not in e.risk_seed_c:
+        if e.audit_seed == None:
+            e.risk_seed_c[cid] = int(audit.auditRandomState.randint(2**31))
+        else:
+            hash_input = bytearray(str(e.audit_seed)+",risk,"+cid, 'utf-8')
+            e.risk_seed_c[cid] = audit_orders.sha256(hash_input)
+    return e.risk_seed_c[cid]
+
+
+##############################################################################
+# Risk measurement jobs
+# A risk job is a dict holding everything needed to estimate the risks
+# for one or more measurements on a single contest, so that the estimate
+# can be made in another process, without the Election.
+
+def make_risk_job(e, mids, sn_tcpra, trials=None, rs=None, adaptive=None,
+                  cs=None):
+    """
+    Return risk job for the given list of mids (all on the same contest);
+    see compute_risk for the other arguments.
+    If rs is None, the job uses the contest's own random stream
+    (see contest_seed).
+    If cs is given, it is the strata.ContestStrata to use, and
+    sn_tcpra is ignored.
+    """
+
+    cid = e.cid_m[mids[0]]
+    assert all([e.cid_m[mid] == cid for mid in mids])
+    if trials == None:
+        trials = e.n_trials
+    if adaptive == None:
+        adaptive = e.adaptive_trials
+    chunk = e.n_trials_batch
+    if adaptive:
+        chunk = min(chunk, e.n_trials_chunk)
+    if rs == None:
+        rs = contest_seed(e, cid)
+    if cs == None:
+        cs = strata.get_strata(e, cid, sn_tcpra)
+    return {"mids": list(mids),
+            "strata": cs,
+            "contest_type": e.contest_type_c[cid],
+            "ro_index": reported_outcome_index(e, cid, cs),
+            "trials": trials,
+            "chunk": chunk,
+            "adaptive": adaptive,
+            "confidence": e.adaptive_confidence,
+            "risk_limit_m": {mid: e.risk_limit_m[mid] for mid in mids},
+            "risk_upset_m": {mid: e.risk_upset_m[mid] for mid in mids},
+            "rs": rs}
+
+
+def run_risk_job(job):
+    """
+    Run risk job; return dict mapping each of its mids to
+    (wrong_outcome_count, trials_done).
+
+    Trials are run in batches of at most job["chunk"] trials; all
+    posterior draws for a batch are made at once (see
+    draw_test_tallies), and their outcomes are all compared with the
+    reported outcome at once (see outcomes.outcome_batch).
+    The same draws are used for all of the job's mids.
+    With job["adaptive"], a mid is finished once the Wilson interval
+    for its risk lies entirely below its risk limit or entirely above
+    its upset threshold; we stop when all mids are finished.
+    """
+
+    rs = job["rs"]
+    if not isinstance(rs, np.random.RandomState):
+        rs = utils.RandomState(rs)
+    cs = job["strata"]
+    # Draw from posterior for each paper ballot collection, sum them.
+    # Stratify by reported vote.
+    # Actual votes that can't win are lumped together (see strata.py).
+    votes, lump_v = cs.lumping(job["contest_type"])
+    alpha_sv, nonsample_s = cs.posterior(lump_v=lump_v)
+    valid_v = outcomes.plurality_valid_mask(votes)
+    ro_index = lumped_index(job["ro_index"], lump_v)
+    result_m = {}
+    wrong_outcome_count = 0
+    trials_done = 0
+    while trials_done < job["trials"] and len(result_m) < len(job["mids"]):
+        batch = min(job["chunk"], job["trials"] - trials_done)
+        test_tally_tv = draw_test_tallies(alpha_sv, nonsample_s, batch, rs)
+        outcome_t = outcomes.outcome_batch(job["contest_type"], votes,
+                                           test_tally_tv, valid_v)
+        wrong_outcome_count += int(np.sum(outcome_t != ro_index))
+        trials_done += batch
+        if job["adaptive"]:
+            lo, hi = wilson_interval(wrong_outcome_count, trials_done,
+                                     job["confidence"])
+            for mid in job["mids"]:
+                if mid not in result_m and \
+                   (hi < job["risk_limit_m"][mid] or
+                    lo > job["risk_upset_m"][mid]):
+                    result_m[mid] = (wrong_outcome_count, trials_done)
+    for mid in job["mids"]:
+        if mid not in result_m:
+            result_m[mid] = (wrong_outcome_count, trials_done)
+    return result_m
+
+
+def record_risk(e, mid, wrong_outcome_count, trials_done):
+    """
+    Save risk for mid, with number of trials used and its interval,
+    in e.risk_tm, e.risk_trials_tm, and e.risk_interval_tm.
+    Return the risk.
+    """
+
+    risk = wrong_outcome_count / trials_done
+    e.risk_tm[e.stage_time][mid] = risk
+    utils.nested_set(e.risk_trials_tm, [e.stage_time, mid], trials_done)
+    utils.nested_set(e.risk_interval_tm, [e.stage_time, mid],
+                     wilson_interval(wrong_outcome_count, trials_done,
+                                     e.adaptive_confidence))
+    return risk
+
+
+def compute_risk(e, mid, sn_tcpra, trials=None, rs=None, adaptive=None):
     """ 
     Compute (estimate) Bayesian risk (chance that reported 
     outcome is wrong for contest e.cid_m[mid]).
@@ -77,6 +298,9 @@ def compute_risk(e, mid, sn_tcpra, trials=None):
     identical to) e.sn_tcpra.
     Here trials is the number of trials to run to obtain the desired
     precision in the risk estimate.
+    Parameter rs, if present, is a numpy.random.RandomState object;
+    by default the contest's own stream is used (see contest_seed),
+    so the result is reproducible from the audit seed.
 
     This method is the heart of the Bayesian post-election audit method.
     But it could be replaced by a frequentist approach instead, at
@@ -86,47 +310,77 @@ def compute_risk(e, mid, sn_tcpra, trials=None):
     The comparison and ballot-polling audits are blended here; the
     reported election data just records a ("-noCVR",) vote for the 
     reported vote in a noCVR paper ballot collection.
+
+    If adaptive is True (default e.adaptive_trials), trials are run in
+    chunks of e.n_trials_chunk, and we stop early once the Wilson
+    interval (at confidence e.adaptive_confidence) for the risk lies
+    entirely below e.risk_limit_m[mid] or entirely above
+    e.risk_upset_m[mid]; trials is then only an upper bound.
+    The number of trials actually run and the final interval are saved
+    in e.risk_trials_tm and e.risk_interval_tm.
     """
 
-    cid = e.cid_m[mid]
-    wrong_outcome_count = 0
-    if trials == None:
-        trials = e.n_trials
-    for trial in range(trials):
-        test_tally = {vote: 0 for vote in e.votes_c[cid]}
-        for pbcid in sorted(e.possible_pbcid_c[cid]):
-            # Draw from posterior for each paper ballot collection, sum them.
-            # Stratify by reported vote.
-            for rv in sorted(sn_tcpra[e.stage_time][cid][pbcid]):
-                tally = sn_tcpra[e.stage_time][cid][pbcid][rv].copy()
-                for av in e.votes_c[cid]:
-                    if av not in tally:
-                        tally[av] = 0
-                    tally[av] += (e.pseudocount_match if av==rv
-                                  else e.pseudocount_base)
-                dirichlet_dict = dirichlet(tally)
-                stratum_size = e.rn_cpr[cid][pbcid][rv]
-                # sample_size = sn_tcpr[e.stage_time][cid][pbcid][rv]  
-                sample_size = sum([sn_tcpra[e.stage_time][cid][pbcid][rv][av]
-                                   for av in sn_tcpra[e.stage_time][cid][pbcid][rv]])
-                nonsample_size = stratum_size - sample_size
-                for av in sorted(tally):
-                    test_tally[av] += tally[av]
-                    test_tally[av] += dirichlet_dict[av] * nonsample_size
-        if e.ro_c[cid] != outcomes.compute_outcome(e, cid, test_tally):  
-            wrong_outcome_count += 1
-    risk = wrong_outcome_count / e.n_trials
-    e.risk_tm[e.stage_time][mid] = risk
-    return risk
+    job = make_risk_job(e, [mid], sn_tcpra, trials, rs, adaptive)
+    wrong_outcome_count, trials_done = run_risk_job(job)[mid]
+    return record_risk(e, mid, wrong_outcome_count, trials_done)
+
+
+def mids_by_contest(e, mids=None):
+    """
+    Return list of lists of mids (default e.mids), grouped by contest,
+    in order of first appearance.
+    """
+
+    if mids == None:
+        mids = e.mids
+    mids_c = {}
+    for mid in mids:
+        mids_c.setdefault(e.cid_m[mid], []).append(mid)
+    return list(mids_c.values())
 
 
 def compute_risks(e, st, trials=None):
     """
     Compute risks for all measurements, for current sample.
+
+    The posterior is drawn once per contest, and all measurements on
+    that contest are evaluated against the same draws.
+    Contests are computed in up to e.n_jobs worker processes.
+    Since each contest has its own random stream, the results
+    are the same for any number of workers.
+
+    Results for contests whose sufficient statistics are unchanged
+    since an earlier stage or run are taken from the risk cache
+    (see risk_cache.py).
+
+    Measurements whose risk measurement method is "BayesNormal" are
+    computed analytically by risk_normal.py instead, when their
+    contest is a two-candidate plurality contest.
     """
 
+    mc_mids = []
     for mid in e.mids:
-        compute_risk(e, mid, st, trials)
+        if e.risk_method_m[mid] == "BayesNormal" and \
+           risk_normal.applicable(e, mid, st):
+            risk_normal.compute_risk(e, mid, st)
+        else:
+            mc_mids.append(mid)
+    jobs = [make_risk_job(e, mids, st, trials)
+            for mids in mids_by_contest(e, mc_mids)]
+    cache = risk_cache.read_cache(e)
+    keys = [risk_cache.job_key(job) for job in jobs]
+    results = [risk_cache.lookup(cache, key) for key in keys]
+    todo = [j for j in range(len(jobs)) if results[j] == None]
+    for j, result_m in zip(todo,
+                           utils.parallel_map(run_risk_job,
+                                              [jobs[j] for j in todo],
+                                              e.n_jobs)):
+        results[j] = result_m
+        risk_cache.store(cache, keys[j], result_m)
+    for result_m in results:
+        for mid in result_m:
+            record_risk(e, mid, *result_m[mid])
+    risk_cache.write_cache(e, cache)
 
 
 def compute_slack_p(e):
@@ -135,18 +389,21 @@ def compute_slack_p(e):
     sample in that pbcid can be increased.
     """
 
-    # sampling so far doesn't depend on mid, so just use first one.
-    mid = e.mids[0]         
-    cid = e.cid_m[mid]
-    slack_p = {}
-    for pbcid in e.pbcids:
-        slack_p[pbcid] = 0
-        for rv in e.rn_cpr[cid][pbcid]:
-            slack_p[pbcid] += e.rn_cpr[cid][pbcid][rv]
-            slack_p[pbcid] -= e.sn_tcpr[e.stage_time][cid][pbcid][rv]
+    # sampling so far doesn't depend on mid, so for each pbcid just
+    # use the first measured contest that includes it.
+    slack_p = {pbcid: 0 for pbcid in e.pbcids}
+    seen_pbcids = set()
+    for mid in e.mids:
+        cs = strata.get_strata(e, e.cid_m[mid])
+        rn_p = cs.rn_p()
+        sn_p = cs.sn_p()
+        for p, pbcid in enumerate(cs.pbcids):
+            if pbcid not in seen_pbcids:
+                seen_pbcids.add(pbcid)
+                slack_p[pbcid] = int(rn_p[p] - sn_p[p])
     return slack_p
 
-def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials):
+def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials, rs=None):
     """
     Return computed risk for given mid 
     if sample sizes were tweaked (increased).
@@ -155,38 +412,146 @@ def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials):
     to increase sample size by in each pbcid.  We must have
         0 <= tweak_p[pbcid] <= slack_p[pbcid]
     for all pbcids.
+
+    The sample counts of each pbcid are scaled up in proportion
+    (see strata.ContestStrata.tweak_scale); only the sample-count
+    array for this one contest is copied.  The risk is not recorded
+    in e.risk_tm.
+
+    Parameter rs, if given, is a numpy.random.RandomState object to draw
+    from; by default the contest's own stream is used (so that repeated
+    calls see the same draws).
     """
 
     for pbcid in e.pbcids:
         assert 0 <= tweak_p[pbcid] <= slack_p[pbcid]
 
     cid = e.cid_m[mid]
+    cs = strata.get_strata(e, cid)
+    tweaked_cs = cs.scaled(cs.tweak_scale(tweak_p))
+    job = make_risk_job(e, [mid], None, trials, rs, adaptive=False,
+                        cs=tweaked_cs)
+    wrong_outcome_count, trials_done = run_risk_job(job)[mid]
+    return wrong_outcome_count / trials_done
 
-    # Compute sn_tcp, as it is not otherwise defined.
-    # (Perhaps this should be computed elsewhere/earlier?)
-    sn_tcp = {}
-    sn_tcp[e.stage_time] = {}
-    sn_tcp[e.stage_time][cid] = {}
-    for pbcid in e.pbcids:
-        sn_tcp[e.stage_time][cid][pbcid] = 0
-        for rv in e.sn_tcpra[e.stage_time][cid][pbcid]:
-            for av in e.sn_tcpra[e.stage_time][cid][pbcid][rv]:
-                sn_tcp[e.stage_time][cid][pbcid] += \
-                    e.sn_tcpra[e.stage_time][cid][pbcid][rv][av]
 
-    # compute sn_tcpra as "tweaked" version of e.sn_tcpra
-    sn_tcpra = copy.deepcopy(e.sn_tcpra)
-    for pbcid in e.pbcids:
-        for rv in sn_tcpra[e.stage_time][cid][pbcid]:
-            for av in e.sn_tcpra[e.stage_time][cid][pbcid][rv]:
-                sn_tcpra[e.stage_time][cid][pbcid][rv][av] += \
-                    tweak_p[pbcid] * sn_tcpra[e.stage_time][cid][pbcid][rv][av] / \
-                                     sn_tcp[e.stage_time][cid][pbcid]
+##############################################################################
+# Common random numbers (CRN) for evaluating tweaks
+# A planner may evaluate risks for many candidate tweaks in the same stage.
+# With fresh random numbers for each, differences between candidates are
+# dominated by Monte Carlo noise.  Instead, in CRN mode, the gamma variates
+# for the untweaked posterior are drawn once per stage and contest (from
+# the contest's own stream), cached in e.crn_gammas_tc, and each tweak is
+# evaluated by adding to those same variates gamma variates for the
+# increase in the hyperparameters, drawn from fixed per-stratum streams
+# (see extend_gammas).
+
+def crn_gammas(e, cid, trials):
+    """
+    Return (alpha_sv, gammas_tsv) for cid at the current stage: the
+    untweaked hyperparameters, and the cached gamma variates drawn
+    for them (computing and caching them if necessary).
+    """
+
+    cached = e.crn_gammas_tc.get(e.stage_time, {}).get(cid)
+    if cached == None or cached[1].shape[0] != trials:
+        # cache only holds current stage
+        for stage_time in list(e.crn_gammas_tc):
+            if stage_time != e.stage_time:
+                del e.crn_gammas_tc[stage_time]
+        cached = draw_crn_gammas(strata.get_strata(e, cid),
+                                 e.contest_type_c[cid],
+                                 contest_seed(e, cid),
+                                 trials)
+        utils.nested_set(e.crn_gammas_tc, [e.stage_time, cid], cached)
+    return cached
+
+
+def draw_crn_gammas(cs, contest_type, seed, trials):
+    """
+    Return (alpha_sv, gammas_tsv): the (lumped) hyperparameters for
+    strata cs, and trials sets of gamma variates drawn for them from
+    the random stream with the given seed.
+    """
+
+    _, lump_v = cs.lumping(contest_type)
+    alpha_sv, _ = cs.posterior(lump_v=lump_v)
+    rs = utils.RandomState(seed)
+    gammas_tsv = rs.gamma(alpha_sv, size=(trials,)+alpha_sv.shape)
+    return alpha_sv, gammas_tsv
+
+
+def crn_stratum_seed(seed, s):
+    """
+    Return seed for the random stream of stratum s (index in the
+    strata) used to extend the CRN gamma variates (see extend_gammas);
+    derived from seed, the seed of the contest's stream.
+    """
+
+    hash_input = bytearray(str(seed)+",crn,"+str(s), 'utf-8')
+    return audit_orders.sha256(hash_input)
+
+
+def extend_gammas(gammas_tsv, alpha_sv, new_alpha_sv, seed):
+    """
+    Return gamma variates for hyperparameters new_alpha_sv, given the
+    variates gammas_tsv for (smaller or equal) hyperparameters alpha_sv.
+    Since a sum of independent gamma(a) and gamma(b) variates is a
+    gamma(a+b) variate, each changed stratum s gets added to it
+    gamma(new_alpha_sv[s] - alpha_sv[s]) variates, drawn from its own
+    fixed random stream (see crn_stratum_seed), so the result is exact
+    and different tweaks still share their random numbers.
+    Strata whose hyperparameters are unchanged are returned exactly.
+    """
+
+    changed_s = np.any(new_alpha_sv != alpha_sv, axis=1)
+    if not np.any(changed_s):
+        return gammas_tsv
+    assert np.all(new_alpha_sv >= alpha_sv), "tweaks must not shrink samples"
+    gammas_tsv = gammas_tsv.copy()
+    trials = gammas_tsv.shape[0]
+    for s in np.nonzero(changed_s)[0]:
+        rs = utils.RandomState(crn_stratum_seed(seed, s))
+        extra_v = new_alpha_sv[s] - alpha_sv[s]
+        gammas_tsv[:, s, :] += rs.gamma(extra_v, size=(trials, len(extra_v)))
+    return gammas_tsv
+
+
+def compute_contest_risk_crn(e, cid, tweak_p, trials):
+    """
+    Return risk for cid if sample sizes were increased by tweak_p,
+    evaluated (in CRN mode) from the stage's cached gamma variates.
+    """
+
+    cs = strata.get_strata(e, cid)
+    alpha_sv, gammas_tsv = crn_gammas(e, cid, trials)
+    return crn_risk(cs, e.contest_type_c[cid],
+                    reported_outcome_index(e, cid, cs),
+                    alpha_sv, gammas_tsv, tweak_p, contest_seed(e, cid))
+
 
-    return compute_risk(e, mid, sn_tcpra, trials)
+def crn_risk(cs, contest_type, ro_index, alpha_sv, gammas_tsv, tweak_p, seed):
+    """
+    Return risk for strata cs if sample sizes were increased by tweak_p,
+    evaluated from the given gamma variates gammas_tsv (drawn for
+    hyperparameters alpha_sv, as by draw_crn_gammas from the stream
+    with the given seed, which also seeds extend_gammas).
+    Here ro_index is the index of the reported outcome in cs.votes.
+    (Needs no Election, so it can run in worker processes.)
+    """
 
+    votes, lump_v = cs.lumping(contest_type)
+    new_alpha_sv, nonsample_s = cs.posterior(cs.tweak_scale(tweak_p), lump_v)
+    gammas_tsv = extend_gammas(gammas_tsv, alpha_sv, new_alpha_sv, seed)
+    dirichlet_tsv = gammas_tsv / gammas_tsv.sum(axis=2, keepdims=True)
+    test_tally_tv = new_alpha_sv.sum(axis=0) + \
+                    np.einsum("tsv,s->tv", dirichlet_tsv, nonsample_s)
+    outcome_t = outcomes.outcome_batch(contest_type, votes, test_tally_tv)
+    return float(np.mean(outcome_t != lumped_index(ro_index, lump_v)))
 
-def compute_risks_with_tweak(e, slack_p, tweak_p, trials):
+
+def compute_risks_with_tweak(e, slack_p, tweak_p, trials, crn=False,
+                             mids=None, rs=None):
     """
     Compute bayes risks for *all* measurements for given 
     tweak_p (sample size increments per pbcid).
@@ -198,16 +563,38 @@ def compute_risks_with_tweak(e, slack_p, tweak_p, trials):
 
     In one planning strategy, based on random walks in tweak space,
     the value of "trials" might always be equal to one.  In this
-    case, risk_m[mid] is always 0 or 1.  This is OK.
+    case, risk_m[mid] is always 0 or 1.  This is OK.  (Such a walk
+    needs fresh draws at each step: give it its own RandomState rs,
+    which is then used instead of the contests' own streams.)
+
+    If mids is given, only the risks for those measurements are computed.
+
+    If crn is True, use common random numbers: all calls in a stage
+    (with the same number of trials) evaluate their tweaks against
+    the same cached gamma variates, so that differences between the
+    risks for different tweaks are not swamped by Monte Carlo noise.
+    Measurements on the same contest then share one evaluation.
     """
 
+    if mids == None:
+        mids = e.mids
     risk_m = {}
-    for mid in e.mids:
+    if crn:
+        for pbcid in e.pbcids:
+            assert 0 <= tweak_p[pbcid] <= slack_p[pbcid]
+        for contest_mids in mids_by_contest(e, mids):
+            risk = compute_contest_risk_crn(e, e.cid_m[contest_mids[0]],
+                                            tweak_p, trials)
+            for mid in contest_mids:
+                risk_m[mid] = risk
+        return risk_m
+    for mid in mids:
         risk_m[mid] = compute_risk_with_tweak(e,
                                               mid,
                                               slack_p,
                                               tweak_p,
-                                              trials)
+                                              trials,
+                                              rs)
     return risk_m
 
 
@@ -253,8 +640,54 @@ def tweak_all(e, mid):   # unused ??
               risk)
                                                                                     
 
+def test_crn_risk(trials=200000):
+    """
+    Compare CRN risks (crn_risk) with fresh Monte Carlo risks (for the
+    tweaked strata) at small and large tweaks, for a close contest with
+    count-one discrepancy cells.  They should agree within Monte Carlo
+    error.  (Run by "python risk_bayes.py".)
+    """
+
+    votes = [("-noCVR",), ("Alice",), ("Bob",)]
+    prior_ra = np.full((3, 3), 0.5)
+    np.fill_diagonal(prior_ra, 50.0)
+    sn_pra = np.zeros((2, 3, 3))
+    rn_pr = np.zeros((2, 3))
+    rn_pr[0, 1:] = [50500, 49500]
+    rn_pr[1, 0] = 10000
+    sn_pra[0, 1, 1] = 48
+    sn_pra[0, 2, 2] = 50
+    sn_pra[0, 2, 1] = 1
+    sn_pra[0, 1, 2] = 1
+    sn_pra[1, 0, 1:] = [11, 9]
+    cs = strata.ContestStrata("test", ["PBC1", "PBC2"], votes,
+                              sn_pra, rn_pr, prior_ra)
+    alpha_sv, gammas_tsv = draw_crn_gammas(cs, "plurality", 7, trials)
+    for tweak in [0, 200, 800]:
+        tweak_p = {"PBC1": tweak, "PBC2": tweak}
+        crn = crn_risk(cs, "plurality", 1, alpha_sv, gammas_tsv, tweak_p, 7)
+        job = {"mids": ["test"],
+               "strata": cs.scaled(cs.tweak_scale(tweak_p)),
+               "contest_type": "plurality",
+               "ro_index": 1,
+               "trials": trials,
+               "chunk": 20000,
+               "adaptive": False,
+               "confidence": 0.99,
+               "risk_limit_m": {"test": 0.0},
+               "risk_upset_m": {"test": 1.0},
+               "rs": 11}
+        wrong_outcome_count, trials_done = run_risk_job(job)["test"]
+        fresh = wrong_outcome_count / trials_done
+        # standard error of the difference of two independent estimates
+        se = np.sqrt((crn * (1 - crn) + fresh * (1 - fresh)) / trials)
+        print("tweak {:4d}: CRN risk {:.5f}  fresh risk {:.5f}  (se {:.5f})"
+              .format(tweak, crn, fresh, se))
+        assert abs(crn - fresh) <= 4 * se + 1e-4
+
+
 if __name__ == "__main__":
 
-    pass
+    test_crn_risk()
 
 
@@ -0,0 +1,145 @@
+# risk_cache.py
+# October 18, 2026
+# python3
+
+"""
+Persistent cache of Monte Carlo risk results, so that a contest whose
+sample has not changed since an earlier stage (or an earlier run of the
+same stage) is not recomputed.
+
+The cache is the file
+    3-audit/34-audit-output/audit-output-risk-cache.json
+It is keyed by a hash of everything a risk job's result depends on
+(see risk_bayes.make_risk_job): the contest's sufficient statistics
+(the per-stratum sample cross-tabs, stratum sizes, and pseudocounts,
+as dense arrays), the outcome rule and reported outcome, the trial
+parameters, the risk limits and upset thresholds (which matter with
+adaptive trials), and the seed of the contest's random stream.  So a
+cache hit gives exactly the result the computation would have given.
+
+Each entry maps mids to [wrong_outcome_count, trials_done].
+Entries are kept in least-recently-used order, and the oldest are
+dropped once there are more than e.risk_cache_size of them.
+A cache size of 0 turns the cache off, as does e.audit_files being
+False (see multi.py).
+"""
+
+import hashlib
+import json
+import os
+
+import multi
+import utils
+
+
+CACHE_VERSION = 2
+# bump this whenever risk_bayes.run_risk_job changes its results,
+# so that old entries are no longer found
+
+
+def cache_pathname(e):
+    """ Return pathname of risk cache file for election e. """
+
+    dirpath = os.path.join(multi.ELECTIONS_ROOT,
+                           e.election_dirname,
+                           "3-audit",
+                           "34-audit-output")
+    return os.path.join(dirpath, "audit-output-risk-cache.json")
+
+
+def job_key(job):
+    """
+    Return cache key (a hex string) for risk job, or None if job
+    cannot be cached (if its random stream is given as a RandomState
+    object rather than as a seed, its draws depend on the stream's
+    history).
+    """
+
+    if not isinstance(job["rs"], int):
+        return None
+    cs = job["strata"]
+    h = hashlib.sha256()
+    params = [CACHE_VERSION,
+              cs.cid,
+              cs.pbcids,
+              [str(vote) for vote in cs.votes],
+              job["mids"],
+              job["contest_type"],
+              job["ro_index"],
+              job["trials"],
+              job["chunk"],
+              job["adaptive"],
+              job["confidence"],
+              sorted(job["risk_limit_m"].items()),
+              sorted(job["risk_upset_m"].items()),
+              str(job["rs"])]
+    h.update(json.dumps(params).encode('utf-8'))
+    for array in [cs.sn_pra, cs.rn_pr, cs.prior_ra]:
+        h.update(str(array.shape).encode('utf-8'))
+        h.update(array.astype(float).tobytes())
+    return h.hexdigest()
+
+
+def read_cache(e):
+    """
+    Return risk cache for e, as a dict (in least-recently-used order)
+    mapping keys to entries; empty if there is no cache file yet, or
+    if the cache is turned off.
+    """
+
+    if e.risk_cache_size <= 0 or not e.audit_files:
+        return {}
+    filename = cache_pathname(e)
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, "r") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        utils.mywarning("Can't read risk cache {}; ignoring it."
+                        .format(filename))
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache["entries"]
+
+
+def write_cache(e, cache):
+    """
+    Write risk cache (after dropping least-recently-used entries
+    beyond e.risk_cache_size).
+    """
+
+    if e.risk_cache_size <= 0 or not e.audit_files:
+        return
+    while len(cache) > e.risk_cache_size:
+        del cache[next(iter(cache))]
+    filename = cache_pathname(e)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w") as file:
+        json.dump({"version": CACHE_VERSION, "entries": cache}, file)
+    os.replace(temp_filename, filename)
+
+
+def lookup(cache, key):
+    """
+    Return cached result (dict mapping mids to
+    (wrong_outcome_count, trials_done)) for key, or None;
+    a hit makes the entry most recently used.
+    """
+
+    if key == None or key not in cache:
+        return None
+    entry = cache.pop(key)
+    cache[key] = entry
+    return {mid: tuple(entry[mid]) for mid in entry}
+
+
+def store(cache, key, result_m):
+    """ Save result for key in cache, as its most recently used entry. """
+
+    if key == None:
+        return
+    cache.pop(key, None)
+    cache[key] = {mid: list(result_m[mid]) for mid in result_m}
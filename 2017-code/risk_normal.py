@@ -0,0 +1,267 @@
+# risk_normal.py
+# October 18, 2026
+# python3
+
+"""
+Routines to compute Bayes risk for two-candidate plurality contests
+analytically, with a normal approximation, instead of by Monte Carlo.
+
+Called by risk_bayes.compute_risks for measurements whose risk
+measurement method (e.risk_method_m[mid]) is "BayesNormal".
+
+The posterior is the same as in risk_bayes.py: for each stratum s
+(a pbcid and reported vote) the actual-vote proportions p_s have a
+Dirichlet(alpha_s) distribution, and the simulated final tally is
+    alpha_s + p_s * nonsample_s
+summed over strata.  If the reported winner w has only one rival l
+(i.e., only two votes can win), the reported outcome is wrong exactly
+when the simulated margin
+    D = sum_s (alpha_sw - alpha_sl) + nonsample_s * (p_sw - p_sl)
+is negative.  The strata are independent, and each term has known mean
+and variance (from the Dirichlet moments), so we approximate D by a
+normal distribution and return P(D < 0) -- no trials at all.
+
+With many ballots per stratum the approximation is very good; for very
+small contests (tens of ballots) the Dirichlet skew makes it noticeably
+off.  Use calibrate() (or run this file) to check it against Monte Carlo.
+"""
+
+import math
+
+import numpy as np
+
+import outcomes
+import risk_bayes
+import strata
+import utils
+
+
+def two_candidate_indices(cs, contest_type, ro_vote):
+    """
+    Return (w, l), the indices in cs.votes of the reported winner ro_vote
+    and of its only rival, if cs is a plurality contest in which exactly
+    two votes can win and ro_vote is one of them.  Otherwise return None.
+    """
+
+    if contest_type.lower() != "plurality" or ro_vote not in cs.votes:
+        return None
+    valid_v = outcomes.plurality_valid_mask(cs.votes)
+    if np.sum(valid_v) != 2:
+        return None
+    w = cs.votes.index(ro_vote)
+    if not valid_v[w]:
+        return None
+    l = [v for v in np.nonzero(valid_v)[0] if v != w][0]
+    return (w, int(l))
+
+
+normal_cdf = np.vectorize(lambda x: 0.5 * math.erfc(-x / math.sqrt(2.0)),
+                          otypes=[float])
+# elementwise standard normal cdf, for numpy arrays
+
+
+def margin_moments_xl(alpha_xsv, nonsample_xs, w, rivals):
+    """
+    Return (mean_xl, var_xl): for each x (e.g. a candidate plan, or a
+    scenario), the mean and variance of the posterior final margin of
+    vote w over each vote l in rivals, when stratum s has Dirichlet
+    hyperparameters alpha_xsv[x, s] and nonsample_xs[x, s] unsampled
+    ballots.  Strata with nonsample 0 and alpha 0 contribute nothing.
+
+    This is the model shared by the "BayesNormal" risk method (below),
+    the surrogate planner (surrogate.py), and the forecast (forecast.py).
+    """
+
+    alpha0_xs = alpha_xsv.sum(axis=2)
+    safe_alpha0_xs = np.where(alpha0_xs > 0, alpha0_xs, 1.0)
+    share_xsv = alpha_xsv / safe_alpha0_xs[:, :, None]
+    w_xs1 = share_xsv[:, :, [w]]
+    margin_xsl = w_xs1 - share_xsv[:, :, rivals]
+    mean_xl = (alpha_xsv[:, :, [w]] - alpha_xsv[:, :, rivals] +
+               nonsample_xs[:, :, None] * margin_xsl).sum(axis=1)
+    var_xsl = (w_xs1 + share_xsv[:, :, rivals] - margin_xsl**2) / \
+              (safe_alpha0_xs[:, :, None] + 1.0)
+    var_xl = (nonsample_xs[:, :, None]**2 * var_xsl).sum(axis=1)
+    return mean_xl, var_xl
+
+
+def normal_risk_xl(mean_xl, var_xl, kappa=1.0):
+    """
+    Return array, over x, of the chance that the margin is negative for
+    some rival (approximated by the sum of the chances for each rival,
+    capped at 1), when the margins are normal with the given means and
+    variances (and standard deviations scaled by kappa).
+    """
+
+    sd_xl = kappa * np.sqrt(var_xl)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_xl = np.where(sd_xl > 0, -mean_xl / sd_xl,
+                        np.where(mean_xl < 0, np.inf, -np.inf))
+    return np.minimum(1.0, normal_cdf(z_xl).sum(axis=1))
+
+
+def normal_risk(cs, w, l, scale_p=None):
+    """
+    Return normal approximation to the chance that vote l beats vote w
+    in the final tally for the contest with strata cs.
+    """
+
+    alpha_sv, nonsample_s = cs.posterior(scale_p)
+    mean_xl, var_xl = margin_moments_xl(alpha_sv[None], nonsample_s[None],
+                                        w, [l])
+    return float(normal_risk_xl(mean_xl, var_xl)[0])
+
+
+def applicable(e, mid, sn_tcpra=None):
+    """ Return True if the normal approximation applies to measurement mid. """
+
+    cid = e.cid_m[mid]
+    cs = strata.get_strata(e, cid, sn_tcpra)
+    return two_candidate_indices(cs, e.contest_type_c[cid], e.ro_c[cid]) != None
+
+
+def compute_risk(e, mid, sn_tcpra=None):
+    """
+    Compute and record (in e.risk_tm) the normal-approximation Bayes
+    risk for measurement mid.  As no trials are used, e.risk_trials_tm
+    is set to 0 and e.risk_interval_tm to the single point (risk, risk).
+
+    If the contest is not a two-candidate plurality contest, fall back
+    to the Monte Carlo risk_bayes.compute_risk.
+    """
+
+    cid = e.cid_m[mid]
+    cs = strata.get_strata(e, cid, sn_tcpra)
+    indices = two_candidate_indices(cs, e.contest_type_c[cid], e.ro_c[cid])
+    if indices == None:
+        return risk_bayes.compute_risk(e, mid, sn_tcpra)
+    risk = normal_risk(cs, *indices)
+    e.risk_tm[e.stage_time][mid] = risk
+    utils.nested_set(e.risk_trials_tm, [e.stage_time, mid], 0)
+    utils.nested_set(e.risk_interval_tm, [e.stage_time, mid], (risk, risk))
+    return risk
+
+
+##############################################################################
+# Calibration against Monte Carlo
+
+def monte_carlo_risk(cs, contest_type, ro_index, trials, seed):
+    """
+    Return (risk, (lo, hi)): Monte Carlo risk estimate for strata cs
+    (as computed by risk_bayes), with its 99% Wilson interval.
+    """
+
+    job = {"mids": ["calibrate"],
+           "strata": cs,
+           "contest_type": contest_type,
+           "ro_index": ro_index,
+           "trials": trials,
+           "chunk": min(trials, 10000),
+           "adaptive": False,
+           "confidence": 0.99,
+           "risk_limit_m": {"calibrate": 0.0},
+           "risk_upset_m": {"calibrate": 1.0},
+           "rs": seed}
+    wrong_outcome_count, trials_done = risk_bayes.run_risk_job(job)["calibrate"]
+    return (wrong_outcome_count / trials_done,
+            risk_bayes.wilson_interval(wrong_outcome_count, trials_done, 0.99))
+
+
+def within_tolerance(risk, interval, tolerance):
+    """ Return True if risk is within tolerance of the given interval. """
+
+    lo, hi = interval
+    return bool(lo - tolerance <= risk <= hi + tolerance)
+
+
+def calibrate(e, mids=None, trials=None, tolerance=0.01):
+    """
+    Check normal-approximation risks against Monte Carlo risks for the
+    two-candidate measurements in mids (default e.mids), for the current
+    stage.  Print a comparison, and return dict mapping each checked mid
+    to (normal risk, Monte Carlo risk, ok), where ok is True if the
+    normal risk is within tolerance of the Monte Carlo 99% interval.
+    Nothing is recorded in e.risk_tm.
+    """
+
+    if mids == None:
+        mids = e.mids
+    if trials == None:
+        trials = e.n_trials
+    result_m = {}
+    utils.myprint("Normal-approximation calibration (tolerance {}):"
+                  .format(tolerance))
+    for mid in mids:
+        cid = e.cid_m[mid]
+        cs = strata.get_strata(e, cid)
+        indices = two_candidate_indices(cs, e.contest_type_c[cid], e.ro_c[cid])
+        if indices == None:
+            continue
+        risk = normal_risk(cs, *indices)
+        mc_risk, interval = monte_carlo_risk(cs, e.contest_type_c[cid],
+                                             indices[0], trials,
+                                             risk_bayes.contest_seed(e, cid))
+        ok = within_tolerance(risk, interval, tolerance)
+        result_m[mid] = (risk, mc_risk, ok)
+        utils.myprint("    {}: normal {:.5f}  Monte Carlo {:.5f}"
+                      " [{:.5f},{:.5f}]  {}"
+                      .format(mid, risk, mc_risk, interval[0], interval[1],
+                              "ok" if ok else "OUT OF TOLERANCE"))
+    return result_m
+
+
+def calibrate_synthetic(n_cases=20, trials=20000, tolerance=0.01, seed=1):
+    """
+    Check normal-approximation risks against Monte Carlo risks on
+    n_cases random two-candidate contests (1 to 4 pbcids, CVR and
+    noCVR, with close and not-so-close margins and some invalid
+    votes).  Print a comparison; return number of cases out of tolerance.
+    """
+
+    rs = utils.RandomState(seed)
+    votes = [("-Invalid",), ("-noCVR",), ("Alice",), ("Bob",)]
+    prior_ra = np.full((4, 4), 0.5)
+    np.fill_diagonal(prior_ra, 50.0)
+    failures = 0
+    for case in range(n_cases):
+        n_pbcids = rs.randint(1, 5)
+        alice_share = rs.uniform(0.45, 0.6)
+        sn_pra = np.zeros((n_pbcids, 4, 4))
+        rn_pr = np.zeros((n_pbcids, 4))
+        for p in range(n_pbcids):
+            size = rs.randint(1000, 100000)
+            sample = rs.randint(20, 500)
+            actual_v = rs.multinomial(sample, [0.01, 0.0,
+                                               alice_share * 0.99,
+                                               (1 - alice_share) * 0.99])
+            if rs.uniform() < 0.5:
+                # noCVR collection: everything reported as ("-noCVR",)
+                rn_pr[p, 1] = size
+                sn_pra[p, 1, :] = actual_v
+            else:
+                # CVR collection: reported votes (nearly always) correct
+                rn_pr[p, [0, 2, 3]] = np.round(size * np.array(
+                    [0.01, alice_share * 0.99, (1 - alice_share) * 0.99]))
+                for v in [0, 2, 3]:
+                    sn_pra[p, v, v] = actual_v[v]
+                sn_pra[p, 3, 2] = rs.binomial(1, 0.3)
+        pbcids = ["pbcid{}".format(p) for p in range(n_pbcids)]
+        cs = strata.ContestStrata("calibrate", pbcids, votes,
+                                  sn_pra, rn_pr, prior_ra)
+        risk = normal_risk(cs, 2, 3)
+        mc_risk, interval = monte_carlo_risk(cs, "plurality", 2, trials,
+                                             seed + case)
+        ok = within_tolerance(risk, interval, tolerance)
+        if not ok:
+            failures += 1
+        print("case {:2d}: {} pbcids  normal {:.5f}  Monte Carlo {:.5f}"
+              " [{:.5f},{:.5f}]  {}"
+              .format(case, n_pbcids, risk, mc_risk, interval[0], interval[1],
+                      "ok" if ok else "OUT OF TOLERANCE"))
+    print("{} of {} cases out of tolerance.".format(failures, n_cases))
+    return failures
+
+
+if __name__ == "__main__":
+
+    calibrate_synthetic()
@@ -64,8 +64,16 @@ def write_state(e, ss):
     Data ss saved is needed in the next audit stage.
     ss is a dict with the saved-state information, including
     the stage_time.
+
+    If e.saved_state_in_memory is True, the state is kept in
+    e.saved_state_t instead of being written to a file.
     """
 
+    if e.saved_state_in_memory:
+        # same as writing and reading back the json file
+        e.saved_state_t[ss["stage_time"]] = json.loads(json.dumps(ss))
+        return
+
     dirpath = os.path.join(multi.ELECTIONS_ROOT,
                            e.election_dirname,
                            "3-audit",
@@ -81,8 +89,13 @@ def write_state(e, ss):
 def read_saved_state(e):
     """
     Read state from latest 3-audit/34-audit-output/audit-output-saved-state.json 
+    (or, if e.saved_state_in_memory is True, from e.saved_state_t).
     """
 
+    if e.saved_state_in_memory:
+        e.saved_state = e.saved_state_t[max(e.saved_state_t)]
+        return
+
     dirpath = os.path.join(multi.ELECTIONS_ROOT,
                            e.election_dirname,
                            "3-audit",
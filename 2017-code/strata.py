@@ -0,0 +1,278 @@
+# strata.py
+# October 18, 2026
+# python3
+
+"""
+Dense (numpy array) representation of the sample and reported counts
+for each contest, for use by the risk-measurement and planning code.
+
+The nested dicts
+    e.sn_tcpra[stage_time][cid][pbcid][rv][av]
+    e.rn_cpr[cid][pbcid][rv]
+are convenient for input and output, but walking them (with sorting)
+inside the risk-measurement trial loop is slow.  So once per stage,
+after audit.draw_sample, each contest is "compiled" into a ContestStrata
+object holding dense arrays indexed by pbcid, reported vote, and actual
+vote.
+
+Each contest has a stable vote-index map
+    e.vote_index_c[cid][vote] -> int
+(with inverse e.votes_list_c[cid]) built from e.votes_c[cid].  Indices
+are assigned to the votes of e.votes_c[cid] in sorted order when the map
+is first built; votes seen later (e.g. actual votes never reported, added
+by add_sample_votes when audit.draw_sample tallies the sample) are
+appended, so existing indices never change.
+
+For the risk computation, the actual votes of a plurality contest that
+can never win (such as ("-Invalid",), ("-noCVR",), undervotes, and
+overvotes) are lumped into a single CANNOT_WIN vote; see
+ContestStrata.lumping.
+"""
+
+import numpy as np
+
+import outcomes
+import utils
+
+
+CANNOT_WIN = ("-cannotWin",)
+# vote standing for all the votes lumped together by ContestStrata.lumping
+
+
+def vote_index(e, cid):
+    """
+    Return the vote-index map for cid, building or extending it as needed
+    so that it covers all of e.votes_c[cid].
+    """
+
+    if cid not in e.vote_index_c:
+        e.votes_list_c[cid] = sorted(e.votes_c[cid])
+        e.vote_index_c[cid] = {vote: i for i, vote
+                               in enumerate(e.votes_list_c[cid])}
+    for vote in sorted(e.votes_c[cid]):
+        add_vote(e, cid, vote)
+    return e.vote_index_c[cid]
+
+
+def add_vote(e, cid, vote):
+    """ Make sure vote has an index for cid (and is in e.votes_c[cid]). """
+
+    e.votes_c[cid][vote] = True
+    if vote not in e.vote_index_c[cid]:
+        e.vote_index_c[cid][vote] = len(e.votes_list_c[cid])
+        e.votes_list_c[cid].append(vote)
+
+
+def add_sample_votes(e, cid, tally2):
+    """
+    Make sure every reported and actual vote in tally2 (a sample tally
+    rv->av->count for cid, as from outcomes.compute_tally2_ids) is in
+    e.votes_c[cid] and has an index for cid.
+    Called by audit.draw_sample when it tallies the sample, so that
+    compile_contest finds every sampled vote already indexed.
+    """
+
+    vote_index(e, cid)
+    for rv in tally2:
+        add_vote(e, cid, rv)
+        for av in tally2[rv]:
+            add_vote(e, cid, av)
+
+
+class ContestStrata(object):
+    """
+    Dense arrays for one contest at one stage.
+
+        cid       the contest id
+        pbcids    sorted list of pbcids in e.possible_pbcid_c[cid];
+                  gives the order of the pbcid axis (p)
+        votes     list of votes; gives the order of the reported-vote (r)
+                  and actual-vote (a) axes (same as e.votes_list_c[cid])
+        sn_pra    sample counts, shape (pbcids, votes, votes)
+        rn_pr     reported counts (stratum sizes), shape (pbcids, votes)
+        prior_ra  Dirichlet pseudocounts, shape (votes, votes):
+                  e.pseudocount_match on the diagonal (rv==av), and
+                  e.pseudocount_base elsewhere
+
+    Sample counts are floats, since planning code may scale them.
+    """
+
+    def __init__(self, cid, pbcids, votes, sn_pra, rn_pr, prior_ra):
+
+        self.cid = cid
+        self.pbcids = pbcids
+        self.pbcid_index = {pbcid: i for i, pbcid in enumerate(pbcids)}
+        self.votes = votes
+        self.sn_pra = sn_pra
+        self.rn_pr = rn_pr
+        self.prior_ra = prior_ra
+
+    def sn_pr(self):
+        """ Return sample counts by pbcid and reported vote. """
+
+        return self.sn_pra.sum(axis=2)
+
+    def sn_p(self):
+        """ Return sample counts by pbcid. """
+
+        return self.sn_pra.sum(axis=(1, 2))
+
+    def rn_p(self):
+        """ Return reported counts by pbcid. """
+
+        return self.rn_pr.sum(axis=1)
+
+    def posterior(self, scale_p=None, lump_v=None):
+        """
+        Return (alpha_sv, nonsample_s) for the strata of this contest.
+
+        A stratum is a (pbcid, rv) pair having sampled ballots; strata
+        with no sampled ballots are skipped (as they always have been
+        in the risk computation).  Strata are in (pbcid, rv) order.
+        Here alpha_sv[s, v] is the Dirichlet hyperparameter (sample count
+        plus pseudocount) for actual vote v in stratum s, and
+        nonsample_s[s] is the number of unsampled ballots in stratum s.
+
+        If scale_p is given (an array parallel to self.pbcids), the
+        sample counts for each pbcid are first multiplied by its scale
+        factor (see tweak_scale); self is not changed.
+
+        If lump_v is given (as from lumping), the actual votes are
+        lumped accordingly: alpha_sv then has one column per lumped vote,
+        holding the sum of the hyperparameters of the votes lumped into
+        it.  (By the aggregation property of the Dirichlet distribution,
+        this gives exactly the distribution of the lumped proportions.)
+        """
+
+        sn_pra = self.sn_pra
+        if scale_p is not None:
+            sn_pra = sn_pra * np.asarray(scale_p, dtype=float)[:, None, None]
+        sn_pr = sn_pra.sum(axis=2)
+        sampled_pr = self.sn_pr() > 0
+        alpha_sv = (sn_pra + self.prior_ra)[sampled_pr]
+        nonsample_s = (self.rn_pr - sn_pr)[sampled_pr]
+        if lump_v is not None:
+            lump_vl = np.zeros((len(self.votes), np.max(lump_v)+1))
+            lump_vl[np.arange(len(self.votes)), lump_v] = 1.0
+            alpha_sv = alpha_sv.dot(lump_vl)
+        return alpha_sv, nonsample_s
+
+    def lumping(self, contest_type):
+        """
+        Return (lumped_votes, lump_v) giving the reduced actual-vote
+        alphabet for the risk computation: lumped_votes is the list
+        of lumped votes, and lump_v is an integer array, parallel to
+        self.votes, giving the index in lumped_votes of each vote.
+
+        For a plurality contest, the votes that can win are kept, in
+        their order in self.votes (so ties are broken the same way),
+        and all other votes are lumped into a single CANNOT_WIN vote
+        at the end.  Otherwise, no votes are lumped.
+        """
+
+        if contest_type.lower() != "plurality":
+            return list(self.votes), np.arange(len(self.votes))
+        valid_v = outcomes.plurality_valid_mask(self.votes)
+        lumped_votes = [vote for vote, valid
+                        in zip(self.votes, valid_v) if valid]
+        lump_v = np.full(len(self.votes), len(lumped_votes))
+        lump_v[valid_v] = np.arange(len(lumped_votes))
+        if not np.all(valid_v):
+            lumped_votes.append(CANNOT_WIN)
+        return lumped_votes, lump_v
+
+    def scaled(self, scale_p):
+        """
+        Return ContestStrata like self, but with the sample counts for
+        each pbcid multiplied by its factor in scale_p (an array parallel
+        to self.pbcids, see tweak_scale).  Only the sample-count array is
+        new; everything else is shared with self.
+        """
+
+        scale_p = np.asarray(scale_p, dtype=float)
+        return ContestStrata(self.cid, self.pbcids, self.votes,
+                             self.sn_pra * scale_p[:, None, None],
+                             self.rn_pr, self.prior_ra)
+
+    def tweak_scale(self, tweak_p):
+        """
+        Return array, parallel to self.pbcids, of factors by which the
+        sample counts of each pbcid would be scaled if its sample size
+        were increased by tweak_p[pbcid] (keeping the same proportions
+        of reported/actual vote pairs).
+        Pbcids with no sample yet keep scale factor 1.
+        """
+
+        sn_p = self.sn_p()
+        scale_p = np.ones(len(self.pbcids))
+        for p, pbcid in enumerate(self.pbcids):
+            if sn_p[p] > 0:
+                scale_p[p] = 1.0 + tweak_p[pbcid] / sn_p[p]
+        return scale_p
+
+
+def compile_contest(e, cid, sn_tcpra):
+    """
+    Return ContestStrata for cid at e.stage_time, from given sn_tcpra
+    (which has the same structure as, and is usually, e.sn_tcpra).
+    Every vote in sn_tcpra must already be in e.votes_c[cid]; votes
+    sampled by audit.draw_sample are added there (see add_sample_votes)
+    when the sample is tallied.  This routine does not change e.votes_c.
+    """
+
+    index = vote_index(e, cid)
+    votes = e.votes_list_c[cid]
+    pbcids = sorted(e.possible_pbcid_c[cid])
+    n_votes = len(votes)
+
+    sn_pra = np.zeros((len(pbcids), n_votes, n_votes))
+    rn_pr = np.zeros((len(pbcids), n_votes))
+    for p, pbcid in enumerate(pbcids):
+        for rv in e.rn_cpr[cid][pbcid]:
+            rn_pr[p, index[rv]] = e.rn_cpr[cid][pbcid][rv]
+        tally2 = sn_tcpra[e.stage_time][cid][pbcid]
+        for rv in tally2:
+            for av in tally2[rv]:
+                if rv not in index or av not in index:
+                    utils.myerror(("strata.compile_contest: sampled vote {} or {} "
+                                   "for contest {} not in e.votes_c.")
+                                  .format(rv, av, cid))
+                sn_pra[p, index[rv], index[av]] = tally2[rv][av]
+
+    prior_ra = np.full((n_votes, n_votes), float(e.pseudocount_base))
+    np.fill_diagonal(prior_ra, e.pseudocount_match)
+
+    return ContestStrata(cid, pbcids, list(votes), sn_pra, rn_pr, prior_ra)
+
+
+def compile_strata(e):
+    """
+    Compile e.sn_tcpra and e.rn_cpr for the current stage into
+    e.strata_tc[e.stage_time][cid], for every cid.
+    Called once per stage, after audit.draw_sample.
+    Only the current stage's arrays are kept; those of earlier stages
+    are dropped (as for e.crn_gammas_tc in risk_bayes.py).
+    """
+
+    for stage_time in list(e.strata_tc):
+        if stage_time != e.stage_time:
+            del e.strata_tc[stage_time]
+    e.strata_tc[e.stage_time] = {}
+    for cid in e.cids:
+        e.strata_tc[e.stage_time][cid] = compile_contest(e, cid, e.sn_tcpra)
+
+
+def get_strata(e, cid, sn_tcpra=None):
+    """
+    Return ContestStrata for cid at the current stage.
+
+    If sn_tcpra is None or is e.sn_tcpra, the compiled arrays for the
+    stage are used (compiling them if not done yet); otherwise the given
+    sn_tcpra is compiled on the fly.
+    """
+
+    if sn_tcpra is None or sn_tcpra is e.sn_tcpra:
+        if e.stage_time not in e.strata_tc:
+            compile_strata(e)
+        return e.strata_tc[e.stage_time][cid]
+    return compile_contest(e, cid, sn_tcpra)
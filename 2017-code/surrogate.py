@@ -0,0 +1,125 @@
+# surrogate.py
+# October 18, 2026
+# python3
+
+"""
+Gaussian surrogate risk model for screening candidate sampling plans,
+generalizing PQ.f of opt/f.py from a toy contest to real plurality
+contests.
+
+As in opt/f.py, the estimated total margin of the reported winner w
+over a rival l is treated as normal.  Its mean is the sum, over strata
+(pbcid and reported vote), of the sampled margin plus the number of
+unsampled ballots times the estimated per-ballot margin; its variance
+is the sum of
+    nonsample^2 * per-ballot variance / (sample size + 1)
+(the n_i^2/s_i of opt/f.py, with the per-ballot variance of the margin,
+counting only unsampled ballots).  Per-ballot vote shares are the
+posterior means (sample counts plus pseudocounts, see strata.py), with
+votes that can't win lumped together; these are the moments of the
+Bayes posterior, computed (as for the "BayesNormal" risk method) by
+risk_normal.margin_moments_xl.  For several rivals the risk is taken
+to be the sum of the chances of losing to each (capped at 1).
+
+Increasing a pbcid's sample (a "tweak", as in
+risk_bayes.compute_risks_with_tweak) is modeled as scaling up the
+sample counts of its strata in proportion (see
+strata.ContestStrata.tweak_scale).  The risk for thousands of
+candidate plans is computed at once with a few array operations.
+
+The surrogate is calibrated each stage against the Monte Carlo risk
+for the current sample: the standard deviations are multiplied by a
+factor kappa chosen so that the surrogate risk with no tweak equals
+the Monte Carlo risk.
+"""
+
+import numpy as np
+
+import outcomes
+import risk_normal
+
+
+class ContestSurrogate(object):
+    """
+    Gaussian surrogate for the risk of one contest.
+
+        cs         strata.ContestStrata for the contest
+        contest_type   the contest type (only plurality is modeled)
+        ro_index   index in cs.votes of reported outcome (or -1)
+        pbcids     list of pbcids giving the order of the pbcid axis
+                   of the tweaks passed to risk()
+    """
+
+    def __init__(self, cs, contest_type, ro_index, pbcids):
+
+        self.cid = cs.cid
+        self.n_pbcids = len(pbcids)
+        self.kappa = 1.0
+        votes, lump_v = cs.lumping(contest_type)
+        valid_v = outcomes.plurality_valid_mask(votes)
+        self.possible = contest_type.lower() == "plurality" and \
+                        ro_index >= 0 and valid_v[lump_v[ro_index]]
+        if not self.possible:
+            return
+        self.w = lump_v[ro_index]
+        self.rivals = [v for v in range(len(votes)) if valid_v[v] and v != self.w]
+        alpha_sv, self.nonsample_s = cs.posterior(lump_v=lump_v)
+        self.prior_sv, _ = cs.posterior(np.zeros(len(cs.pbcids)), lump_v)
+        self.sample_sv = alpha_sv - self.prior_sv
+        sn_p = cs.sn_p()
+        p_s, _ = np.nonzero(cs.sn_pr() > 0)
+        self.pbcid_s = np.array([pbcids.index(cs.pbcids[p]) for p in p_s],
+                                dtype=int)
+        self.sn_p_s = sn_p[p_s]
+
+    def moments(self, tweak_cp):
+        """
+        Return (mean_cl, var_cl): mean and variance of the margin of the
+        reported winner over each rival l, for each row of tweak_cp.
+        """
+
+        scale_cs = 1.0 + tweak_cp[:, self.pbcid_s] / self.sn_p_s
+        alpha_csv = self.sample_sv * scale_cs[:, :, None] + self.prior_sv
+        nonsample_cs = np.maximum(0.0, self.nonsample_s - 
+                                  self.sample_sv.sum(axis=1) * (scale_cs - 1.0))
+        return risk_normal.margin_moments_xl(alpha_csv, nonsample_cs,
+                                             self.w, self.rivals)
+
+    def risk(self, tweak_cp):
+        """
+        Return array of surrogate risks, one for each row of tweak_cp,
+        an array (candidates x pbcids) of sample-size increments.
+        """
+
+        tweak_cp = np.atleast_2d(np.asarray(tweak_cp, dtype=float))
+        if not self.possible:
+            return np.ones(tweak_cp.shape[0])
+        mean_cl, var_cl = self.moments(tweak_cp)
+        return risk_normal.normal_risk_xl(mean_cl, var_cl, self.kappa)
+
+    def calibrate(self, mc_risk):
+        """
+        Set self.kappa so that the surrogate risk with no tweak equals
+        mc_risk (the Monte Carlo risk for the current sample), if some
+        kappa between 0.05 and 20 does so; otherwise leave kappa at 1.
+        Return kappa.
+        """
+
+        zero_p = np.zeros((1, self.n_pbcids))
+        lo, hi = np.log(0.05), np.log(20.0)
+        self.kappa = np.exp(lo)
+        risk_lo = self.risk(zero_p)[0]
+        self.kappa = np.exp(hi)
+        risk_hi = self.risk(zero_p)[0]
+        self.kappa = 1.0
+        if not self.possible or \
+           not min(risk_lo, risk_hi) < mc_risk < max(risk_lo, risk_hi):
+            return self.kappa
+        for _ in range(40):
+            self.kappa = np.exp((lo + hi) / 2)
+            if (self.risk(zero_p)[0] < mc_risk) == (risk_lo < mc_risk):
+                lo = np.log(self.kappa)
+            else:
+                hi = np.log(self.kappa)
+        self.kappa = float(np.exp((lo + hi) / 2))
+        return self.kappa
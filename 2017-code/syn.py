@@ -129,6 +129,12 @@ def parse_args():
                         help="Type of synthetic election. (1 or 2)",
                         default='1')
 
+    parser.add_argument("--seed",
+                        help="Random number seed for syn_type 2"
+                             " (also used as audit seed).",
+                        type=int,
+                        default=1)
+
     args = parser.parse_args()
     return args
 
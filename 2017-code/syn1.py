@@ -323,10 +323,7 @@ def generate_rv_cpb(e, synpar):
 
 def compute_reported_stats(e, synpar):
 
-    reported.compute_rn_cpr(e)
-    reported.compute_rn_c(e)
-    reported.compute_rn_p(e)
-    reported.compute_rn_cr(e)
+    reported.compute_reported_counts(e)
     outcomes.compute_ro_c(e)
 
 
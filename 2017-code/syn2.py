@@ -158,12 +158,21 @@ LnoCVR = [("cid1", "pbcid1", ("-noCVR",), ("Alice",), 3100),
           # ("cid1", "pbcid2", ("-noCVR",), ("Bob",), 5)
          ]
 
-def generate_syn_type_2(e, args):
+def generate_syn_type_2(e, args, write_files=True):
+    """
+    Generate election of type 2 from spec syn2_specs/ELECTION_DIRNAME.csv,
+    where ELECTION_DIRNAME is args.election_dirname.
+
+    The seed args.seed (default 1) is used both to shuffle the votes
+    and as the audit seed.
+    If write_files is False, the election is only generated in e
+    (nothing is written), e.g. for batch.py.
+    """
 
     synpar = copy.copy(args)
     rows = read_syn2_csv(e, synpar)
     process_spec(e, synpar, rows)
-    e.audit_seed = 1
+    e.audit_seed = getattr(synpar, "seed", 1)
     synpar.RandomState = np.random.RandomState(e.audit_seed)
     shuffle_votes(e, synpar)
     audit_orders.compute_audit_orders(e)
@@ -176,6 +185,7 @@ def generate_syn_type_2(e, args):
             print(key)
             print("    ", vars(e)[key])
 
-    write_csv.write_csv(e)
+    if write_files:
+        write_csv.write_csv(e)
 
 
@@ -8,7 +8,9 @@ Code to work with multi.py on post-election audits.
 Various utilities.
 """
 
+import concurrent.futures
 import datetime
+import hashlib
 import numpy as np
 import os
 import sys
@@ -27,6 +29,24 @@ def datetime_string():
     t = datetime.datetime.now()
     return t.strftime("%Y-%m-%d-%H-%M-%S")
 
+def stage_time_string(last=None):
+    """ Return current datetime, to the microsecond, as string
+        e.g. '2017-06-26-21-18-30-123456'
+        Year-Month-Day-Hours-Minutes-Seconds-Microseconds
+        If last (a string of the same form) is given, the result is
+        greater than last: if the clock hasn't moved past it, last is
+        advanced by one microsecond.
+        Used as stage_time for audit stages run without waiting
+        between them (see audit.audit_headless).
+    """
+
+    t = datetime.datetime.now()
+    if last != None:
+        last_t = datetime.datetime.strptime(last, "%Y-%m-%d-%H-%M-%S-%f")
+        if t <= last_t:
+            t = last_t + datetime.timedelta(microseconds=1)
+    return t.strftime("%Y-%m-%d-%H-%M-%S-%f")
+
 def date_string():
     """ Return current date as string e.g. '2017-06-26' 
         Year-Month-Day
@@ -175,6 +195,18 @@ def count_on(start, num):
         return [start]
     if isinstance(start, int):
         return list(range(start, start+num))
+    prefix, counter, template = count_on_template(start)
+    ans = [prefix + template.format(counter+i) \
+           for i in range(num)]
+    return ans
+
+
+def count_on_template(start):
+    """
+    Return (prefix, counter, template) for string start, as used by
+    count_on: the i-th value is prefix + template.format(counter+i).
+    """
+
     assert isinstance(start, str)
     prefix = list(start)
     digits = []
@@ -186,9 +218,21 @@ def count_on(start, num):
     counter = int("".join(digits))
     prefix = "".join(prefix)
     template = "{{:0{}d}}".format(len(digits))
-    ans = [prefix + template.format(counter+i) \
-           for i in range(num)]
-    return ans
+    return prefix, counter, template
+
+
+def count_on_item(start, num, i):
+    """
+    Return count_on(start, num)[i], without making the whole list.
+    """
+
+    assert 0 <= i < num
+    if num == 1:
+        return start
+    if isinstance(start, int):
+        return start + i
+    prefix, counter, template = count_on_template(start)
+    return prefix + template.format(counter+i)
 
 
 def test_count_on():
@@ -266,6 +310,85 @@ def RandomState(seed):
         return np.random.RandomState(seed)
 
 
+##############################################################################
+## parallel_map -- map over items using a pool of worker processes
+
+def parallel_map(fn, items, n_jobs):
+    """
+    Return list [fn(item) for item in items], computed with up to
+    n_jobs worker processes (or in this process, if n_jobs <= 1 or
+    there is at most one item).
+    Here fn must be a module-level function, and items and results
+    must be picklable.  The order of results matches that of items.
+    """
+
+    items = list(items)
+    if n_jobs <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(fn, items))
+
+
+def make_pool(n_jobs, initializer=None, initargs=()):
+    """
+    Return a pool of up to n_jobs worker processes, each of which
+    first calls initializer(*initargs) (if initializer is given);
+    use it with pool_map, and call close_pool when done.
+    If n_jobs <= 1, no processes are started: the initializer is called
+    in this process, and None is returned (pool_map then runs serially).
+    """
+
+    if n_jobs <= 1:
+        if initializer != None:
+            initializer(*initargs)
+        return None
+    return concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs,
+                                                  initializer=initializer,
+                                                  initargs=initargs)
+
+
+def pool_map(pool, fn, items):
+    """
+    Return list [fn(item) for item in items], computed using pool
+    (from make_pool); requirements are as for parallel_map.
+    """
+
+    if pool == None:
+        return [fn(item) for item in items]
+    return list(pool.map(fn, items))
+
+
+def close_pool(pool):
+    """ Shut down pool (from make_pool). """
+
+    if pool != None:
+        pool.shutdown()
+
+
+##############################################################################
+## file hashing
+
+def file_sha256(filename, n_bytes=None, start=0):
+    """
+    Return hex SHA-256 hash of file filename from byte offset start on,
+    or of just the n_bytes bytes from there if n_bytes is not None.
+    """
+
+    h = hashlib.sha256()
+    with open(filename, "rb") as file:
+        file.seek(start)
+        remaining = n_bytes
+        while remaining == None or remaining > 0:
+            block_size = 2**20 if remaining == None else min(2**20, remaining)
+            block = file.read(block_size)
+            if len(block) == 0:
+                break
+            h.update(block)
+            if remaining != None:
+                remaining -= len(block)
+    return h.hexdigest()
+
+
 ##############################################################################
 ## nested_set -- convenient utility to assign into a tree of nested dicts
 